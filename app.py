@@ -2,6 +2,8 @@ import os
 from datetime import datetime
 from flask import Flask, render_template, request, jsonify, Response
 from werkzeug.utils import secure_filename
+from cachetools import TTLCache
+import orjson
 import cv2
 import numpy as np
 from detector.video_processor import VideoProcessor
@@ -10,6 +12,8 @@ from detector.business_analytics import BusinessAnalytics
 import logging
 import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Configurar logging
 logging.basicConfig(
@@ -21,16 +25,29 @@ logging.basicConfig(
     ]
 )
 logger = logging.getLogger(__name__)
+# Evita uma linha de log de acesso por requisição (polling e stream de vídeo)
+logging.getLogger('werkzeug').setLevel(logging.WARNING)
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv'}
+UPLOAD_BUFFER_SIZE = 1024 * 1024  # 1MB por escrita (padrão do werkzeug é 16KB)
+
+# Conexão às fontes enviadas por upload fora da thread da requisição
+upload_pool = ThreadPoolExecutor(max_workers=2)
 
 # Ensure required directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs('events', exist_ok=True)
 
+# Opções do orjson: aceita tipos NumPy e chaves não-string (ex.: horários de pico)
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# Cache de curta duração (JSON já serializado) para as rotas consultadas periodicamente
+INSIGHTS_CACHE = TTLCache(maxsize=8, ttl=1.0)
+insights_cache_lock = threading.Lock()
+
 # Initialize video processor and event logger
 try:
     video_processor = VideoProcessor(business_type='supermarket')
@@ -43,6 +60,29 @@ except Exception as e:
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def json_response(body, status=200):
+    """Monta uma resposta JSON a partir de bytes já serializados"""
+    return Response(body, status=status, mimetype='application/json')
+
+def cached_json(name, compute):
+    """Retorna o JSON em cache para o tipo de negócio atual ou o recalcula"""
+    key = (video_processor.business_analytics.business_type, name)
+    with insights_cache_lock:
+        body = INSIGHTS_CACHE.get(key)
+    if body is None:
+        body = orjson.dumps(compute(), option=ORJSON_OPTIONS, default=list)
+        with insights_cache_lock:
+            INSIGHTS_CACHE[key] = body
+    return body
+
+def connect_uploaded_file(filepath):
+    """Conecta o processador de vídeo a um arquivo enviado por upload"""
+    try:
+        if not video_processor.connect(filepath):
+            logger.error(f"Erro ao processar o arquivo: {filepath}")
+    except Exception as e:
+        logger.error(f"Erro ao processar o arquivo {filepath}: {str(e)}")
+
 @app.route('/')
 def index():
     try:
@@ -58,20 +98,34 @@ def set_business_type():
         business_type = data.get('business_type')
         if not business_type:
             return jsonify({'error': 'Tipo de negócio não fornecido'}), 400
-        video_processor.business_analytics.business_type = business_type
-        video_processor.business_analytics.reset_metrics()
-        # Atualizar o event_logger para novo tipo de negócio
-        global event_logger
-        event_logger = EventLogger('events/detection_events.txt', business_type=business_type)
+        video_processor.business_analytics.set_business_type(business_type)
+        with insights_cache_lock:
+            INSIGHTS_CACHE.clear()
+        event_logger.set_business_type(business_type)
         return jsonify({'message': f'Tipo de negócio alterado para {business_type}'})
     except Exception as e:
         logger.error(f"Erro ao alterar tipo de negócio: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/set_frame_skip', methods=['POST'])
+def set_frame_skip():
+    try:
+        data = request.get_json()
+        frame_skip = int(data.get('frame_skip', 0))
+        if frame_skip < 1:
+            return jsonify({'error': 'frame_skip deve ser um inteiro maior ou igual a 1'}), 400
+        video_processor.business_analytics.frame_skip = frame_skip
+        return jsonify({'message': f'Análise de 1 a cada {frame_skip} frames'})
+    except (TypeError, ValueError):
+        return jsonify({'error': 'frame_skip deve ser um inteiro maior ou igual a 1'}), 400
+    except Exception as e:
+        logger.error(f"Erro ao alterar frame_skip: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/get_business_insights')
 def get_business_insights():
     try:
-        return jsonify(video_processor.get_business_insights())
+        return json_response(cached_json('insights', video_processor.get_metrics))
     except Exception as e:
         logger.error(f"Erro ao obter insights: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -88,13 +142,11 @@ def upload_file():
     if file:
         filename = secure_filename(file.filename)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        file.save(filepath, buffer_size=UPLOAD_BUFFER_SIZE)
         
-        # Inicia a detecção com o arquivo salvo
-        if video_processor.connect(filepath):
-            return jsonify({'message': 'Arquivo enviado e processamento iniciado'})
-        else:
-            return jsonify({'error': 'Erro ao processar o arquivo'}), 500
+        # Inicia a detecção com o arquivo salvo em segundo plano
+        upload_pool.submit(connect_uploaded_file, filepath)
+        return jsonify({'message': 'Arquivo enviado, processamento sendo iniciado'}), 202
 
 @app.route('/start_detection', methods=['POST'])
 def start_detection():
@@ -126,9 +178,11 @@ def stop_detection():
 @app.route('/video_feed')
 def video_feed():
     try:
-        logger.info("Iniciando stream de vídeo")
-        return Response(video_processor.generate_frames(),
-                        mimetype='multipart/x-mixed-replace; boundary=frame')
+        logger.debug("Iniciando stream de vídeo")
+        response = Response(video_processor.generate_frames(),
+                            mimetype='multipart/x-mixed-replace; boundary=frame')
+        response.direct_passthrough = True
+        return response
     except Exception as e:
         logger.error(f"Erro na rota de video_feed: {str(e)}")
         return "Erro ao gerar stream de vídeo", 500
@@ -139,8 +193,7 @@ def get_insights():
         if not video_processor.is_running:
             return jsonify({'error': 'Stream não está ativo'}), 400
         
-        metrics = video_processor.get_metrics()
-        return jsonify(metrics)
+        return json_response(cached_json('insights', video_processor.get_metrics))
     except Exception as e:
         logger.error(f"Erro ao obter insights: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -148,8 +201,7 @@ def get_insights():
 @app.route('/get_events')
 def get_events():
     try:
-        events = event_logger.get_events()
-        return jsonify({'events': events})
+        return json_response(cached_json('events', lambda: {'events': event_logger.get_events()}))
     except Exception as e:
         logger.error(f"Erro ao obter eventos: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -167,6 +219,6 @@ def internal_error(error):
 if __name__ == '__main__':
     logger.info("Iniciando servidor Flask...")
     try:
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000, threaded=True)
     except Exception as e:
         logger.error(f"Erro ao iniciar o servidor: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""
+Pós-processamento das caixas detectadas em um frame.
+
+Quando o numba está instalado o kernel é compilado com @njit; caso contrário
+é usada uma implementação equivalente em NumPy.
+"""
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba é opcional
+    NUMBA_AVAILABLE = False
+
+
+def _postprocess_boxes_numpy(xyxy, scale_x, scale_y, width, height, zone_bounds):
+    """Reescala, converte para int32 e limita as caixas (N, 4) ao frame; retorna (caixas, índice da zona)"""
+    boxes = (xyxy * np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)).astype(np.int32)
+    np.clip(boxes[:, 0::2], 0, width - 1, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, height - 1, out=boxes[:, 1::2])
+    zones = np.digitize((boxes[:, 0] + boxes[:, 2]) * 0.5, zone_bounds)
+    return boxes, zones
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True, boundscheck=False)
+    def postprocess_boxes(xyxy, scale_x, scale_y, width, height, zone_bounds):
+        """Reescala, converte para int32 e limita as caixas (N, 4) ao frame; retorna (caixas, índice da zona)"""
+        n = xyxy.shape[0]
+        boxes = np.empty((n, 4), dtype=np.int32)
+        zones = np.empty(n, dtype=np.int64)
+        for i in range(n):
+            for j in range(4):
+                limit = width - 1 if j % 2 == 0 else height - 1
+                value = int(xyxy[i, j] * (scale_x if j % 2 == 0 else scale_y))
+                boxes[i, j] = min(max(value, 0), limit)
+            center_x = (boxes[i, 0] + boxes[i, 2]) * 0.5
+            zone = 0
+            while zone < zone_bounds.shape[0] and center_x >= zone_bounds[zone]:
+                zone += 1
+            zones[i] = zone
+        return boxes, zones
+else:
+    postprocess_boxes = _postprocess_boxes_numpy
@@ -0,0 +1,104 @@
+"""
+Kernels de IoU usados no rastreamento de objetos.
+
+Quando o numba está instalado as funções são compiladas com @njit; caso
+contrário são usadas implementações equivalentes em NumPy.
+"""
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba é opcional
+    NUMBA_AVAILABLE = False
+
+
+def _iou_batch_numpy(boxes, query, out):
+    """Preenche `out` com o IoU entre `query` (4,) e cada linha de `boxes` (N, 4)"""
+    x1 = np.maximum(boxes[:, 0], query[0])
+    y1 = np.maximum(boxes[:, 1], query[1])
+    x2 = np.minimum(boxes[:, 2], query[2])
+    y2 = np.minimum(boxes[:, 3], query[3])
+
+    intersection = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    query_area = (query[2] - query[0]) * (query[3] - query[1])
+    boxes_area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = query_area + boxes_area - intersection
+
+    out[:] = 0
+    np.divide(intersection, union, out=out, where=union > 0)
+    return out
+
+
+def _iou_argmax_above_numpy(boxes, query, thr, mask):
+    """Retorna (índice, IoU) da box com maior IoU acima de `thr` entre as linhas em `mask`, ou (-1, thr)"""
+    if not mask.any():
+        return -1, thr
+    ious = _iou_batch_numpy(boxes, query, np.empty(boxes.shape[0], dtype=np.float32))
+    ious[~mask] = 0
+    best = int(np.argmax(ious))
+    if ious[best] > thr:
+        return best, float(ious[best])
+    return -1, thr
+
+
+def _iou_matrix_numpy(boxes_a, boxes_b):
+    """Retorna a matriz (N, M) de IoU entre as linhas de `boxes_a` (N, 4) e `boxes_b` (M, 4)"""
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    iw = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    ih = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    intersection = np.maximum(iw, 0) * np.maximum(ih, 0)
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def iou_batch(boxes, query, out):
+        """Preenche `out` com o IoU entre `query` (4,) e cada linha de `boxes` (N, 4)"""
+        query_area = (query[2] - query[0]) * (query[3] - query[1])
+        for i in range(boxes.shape[0]):
+            iw = min(boxes[i, 2], query[2]) - max(boxes[i, 0], query[0])
+            ih = min(boxes[i, 3], query[3]) - max(boxes[i, 1], query[1])
+            if iw <= 0 or ih <= 0:
+                out[i] = 0
+                continue
+            intersection = iw * ih
+            union = query_area + (boxes[i, 2] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 1]) - intersection
+            out[i] = intersection / union if union > 0 else 0
+        return out
+
+    @njit(cache=True, fastmath=True)
+    def iou_matrix(boxes_a, boxes_b):
+        """Retorna a matriz (N, M) de IoU entre as linhas de `boxes_a` (N, 4) e `boxes_b` (M, 4)"""
+        out = np.zeros((boxes_a.shape[0], boxes_b.shape[0]), dtype=np.float32)
+        for i in range(boxes_a.shape[0]):
+            iou_batch(boxes_b, boxes_a[i], out[i])
+        return out
+
+    @njit(cache=True, fastmath=True)
+    def iou_argmax_above(boxes, query, thr, mask):
+        """Retorna (índice, IoU) da box com maior IoU acima de `thr` entre as linhas em `mask`, ou (-1, thr)"""
+        best = -1
+        best_iou = thr
+        query_area = (query[2] - query[0]) * (query[3] - query[1])
+        for i in range(boxes.shape[0]):
+            if not mask[i]:
+                continue
+            iw = min(boxes[i, 2], query[2]) - max(boxes[i, 0], query[0])
+            ih = min(boxes[i, 3], query[3]) - max(boxes[i, 1], query[1])
+            if iw <= 0 or ih <= 0:
+                continue
+            intersection = iw * ih
+            union = query_area + (boxes[i, 2] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 1]) - intersection
+            if union > 0 and intersection / union > best_iou:
+                best_iou = intersection / union
+                best = i
+        return best, best_iou
+else:
+    iou_batch = _iou_batch_numpy
+    iou_argmax_above = _iou_argmax_above_numpy
+    iou_matrix = _iou_matrix_numpy
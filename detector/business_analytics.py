@@ -1,14 +1,75 @@
 import json
+import os
+import sys
 import time
 from datetime import datetime, timedelta
 import logging
-from collections import defaultdict
+import threading
+from collections import defaultdict, deque, Counter
 import numpy as np
-from scipy import stats
+from ._iou_numba import iou_argmax_above
+
+# Janela (em segundos) considerada nas contagens de detecções recentes
+HISTORY_WINDOW = 5
+
+# Número máximo de posições guardadas na trajetória de cada objeto rastreado
+TRAJECTORY_LENGTH = 100
+
+# Registro de cada objeto rastreado, na mesma ordem de _track_ids
+TRACK_DTYPE = np.dtype([
+    ('bbox', np.float32, (4,)),
+    ('class_id', np.int32),
+    ('first_seen', np.float64),
+    ('last_seen', np.float64)
+])
+# Capacidade inicial do array de rastreamento (dobra quando enche)
+TRACK_CAPACITY = 64
+
+# Grupos de classes contabilizados em uma única métrica
+SUPERMARKET_PRODUCTS = frozenset({'bottle', 'cup', 'bowl', 'banana', 'apple', 'orange', 'sandwich', 'carrot'})
+PHARMACY_MEDICINE = frozenset({'bottle', 'cup', 'bowl'})
+
+# Regras de insight por tipo de negócio: (métrica, limite, aviso quando a métrica passa do limite)
+INSIGHT_RULES = {
+    'supermarket': (
+        ('person_count', 20, 'Alta movimentação'),
+        ('cart_count', 10, 'Muitos carrinhos em uso'),
+        ('product_count', 50, 'Alto volume de produtos'),
+        ('backpack_count', 5, 'Alto número de mochilas'),
+        ('handbag_count', 5, 'Alto número de bolsas'),
+        ('cellphone_count', 8, 'Alto uso de celulares')
+    ),
+    'pharmacy': (
+        ('person_count', 10, 'Alta movimentação'),
+        ('prescription_count', 5, 'Alto volume de prescrições'),
+        ('medicine_count', 20, 'Alto volume de medicamentos'),
+        ('backpack_count', 3, 'Alto número de mochilas'),
+        ('handbag_count', 3, 'Alto número de bolsas'),
+        ('chair_count', 4, 'Alto uso de cadeiras')
+    ),
+    'condominium': (
+        ('person_count', 15, 'Alta movimentação'),
+        ('car_count', 5, 'Alto fluxo de veículos'),
+        ('bicycle_count', 3, 'Alto fluxo de bicicletas'),
+        ('dog_count', 2, 'Alto número de cachorros'),
+        ('cat_count', 2, 'Alto número de gatos'),
+        ('backpack_count', 4, 'Alto número de mochilas')
+    )
+}
+
+def _slope_r2(y):
+    """Inclinação e coeficiente de determinação da regressão linear de y sobre 0..n-1"""
+    dx = np.arange(len(y)) - (len(y) - 1) / 2
+    dy = y - y.mean()
+    sxy = np.dot(dx, dy)
+    sxx = np.dot(dx, dx)
+    syy = np.dot(dy, dy)
+    slope = sxy / sxx
+    r2 = sxy * sxy / (sxx * syy) if syy else 0.0
+    return slope, r2
 
 class BusinessAnalytics:
     def __init__(self, business_type='supermarket'):
-        self.business_type = business_type
         self.logger = logging.getLogger(__name__)
         
         # Configurações específicas por tipo de negócio
@@ -16,400 +77,292 @@ class BusinessAnalytics:
             'supermarket': {
                 'important_objects': ['person', 'shopping cart', 'bottle', 'cup', 'bowl', 'banana', 'apple', 'orange', 'sandwich', 'carrot', 'cell phone', 'backpack', 'handbag'],
                 'zones': ['entrance', 'middle', 'exit'],
-                'metrics': {
-                    'person_count': {'threshold': 20, 'warning': 'Alta movimentação'},
-                    'cart_count': {'threshold': 10, 'warning': 'Muitos carrinhos em uso'},
-                    'product_count': {'threshold': 50, 'warning': 'Alto volume de produtos'},
-                    'backpack_count': {'threshold': 5, 'warning': 'Alto número de mochilas'},
-                    'handbag_count': {'threshold': 5, 'warning': 'Alto número de bolsas'},
-                    'cellphone_count': {'threshold': 8, 'warning': 'Alto uso de celulares'}
+                'class_groups': {
+                    'person_count': frozenset({'person'}),
+                    'cart_count': frozenset({'shopping cart'}),
+                    'product_count': SUPERMARKET_PRODUCTS,
+                    'backpack_count': frozenset({'backpack'}),
+                    'handbag_count': frozenset({'handbag'}),
+                    'cellphone_count': frozenset({'cell phone'})
                 }
             },
             'pharmacy': {
                 'important_objects': ['person', 'bottle', 'cup', 'bowl', 'book', 'cell phone', 'backpack', 'handbag', 'chair', 'bench'],
                 'zones': ['entrance', 'middle', 'exit'],
-                'metrics': {
-                    'person_count': {'threshold': 10, 'warning': 'Alta movimentação'},
-                    'prescription_count': {'threshold': 5, 'warning': 'Alto volume de prescrições'},
-                    'medicine_count': {'threshold': 20, 'warning': 'Alto volume de medicamentos'},
-                    'backpack_count': {'threshold': 3, 'warning': 'Alto número de mochilas'},
-                    'handbag_count': {'threshold': 3, 'warning': 'Alto número de bolsas'},
-                    'chair_count': {'threshold': 4, 'warning': 'Alto uso de cadeiras'}
+                'class_groups': {
+                    'person_count': frozenset({'person'}),
+                    'prescription_count': frozenset({'book'}),
+                    'medicine_count': PHARMACY_MEDICINE,
+                    'backpack_count': frozenset({'backpack'}),
+                    'handbag_count': frozenset({'handbag'}),
+                    'chair_count': frozenset({'chair'})
                 }
             },
             'condominium': {
                 'important_objects': ['person', 'car', 'bicycle', 'motorcycle', 'truck', 'dog', 'cat', 'backpack', 'handbag'],
                 'zones': ['entrance', 'middle', 'exit'],
-                'metrics': {
-                    'person_count': {'threshold': 15, 'warning': 'Alta movimentação'},
-                    'car_count': {'threshold': 5, 'warning': 'Alto fluxo de veículos'},
-                    'bicycle_count': {'threshold': 3, 'warning': 'Alto fluxo de bicicletas'},
-                    'dog_count': {'threshold': 2, 'warning': 'Alto número de cachorros'},
-                    'cat_count': {'threshold': 2, 'warning': 'Alto número de gatos'},
-                    'backpack_count': {'threshold': 4, 'warning': 'Alto número de mochilas'}
+                'class_groups': {
+                    'person_count': frozenset({'person'}),
+                    'car_count': frozenset({'car'}),
+                    'bicycle_count': frozenset({'bicycle'}),
+                    'dog_count': frozenset({'dog'}),
+                    'cat_count': frozenset({'cat'}),
+                    'backpack_count': frozenset({'backpack'})
                 }
             }
         }
         
+        # Mapeamento classe -> métrica contabilizada, por tipo de negócio
+        self._class_to_metric = {
+            business_type: {class_name: metric_key
+                            for metric_key, classes in config['class_groups'].items()
+                            for class_name in classes}
+            for business_type, config in self.business_configs.items()
+        }
+        
+        # Serializa a thread de análise e as rotas (troca de tipo, reset e leitura dos insights)
+        self._lock = threading.RLock()
+        
+        self.business_type = business_type
+        
+        # Identificador inteiro de cada classe vista, usado no filtro por classe do rastreamento
+        self._class_ids = {}
+        
+        # Processa apenas 1 a cada `frame_skip` frames (1 = todos); as contagens são escaladas por frame_skip
+        self.frame_skip = max(1, int(os.environ.get('ANALYTICS_FRAME_SKIP', '1')))
+        self._skip_ctr = 0
+        
         # Inicializa contadores e métricas
         self.reset_metrics()
         
+    @property
+    def business_type(self):
+        return self._business_type
+        
+    @business_type.setter
+    def business_type(self, business_type):
+        self._business_type = business_type
+        # Regras (métrica, limite, aviso) avaliadas em get_business_insights
+        self._threshold_list = INSIGHT_RULES.get(business_type, ())
+        # Mapeamento classe -> métrica do tipo atual, consultado a cada detecção
+        self._metric_for_class = self._class_to_metric.get(business_type, {})
+        
+    def set_business_type(self, business_type):
+        """Troca o tipo de negócio e reseta as métricas de forma atômica"""
+        with self._lock:
+            self.business_type = business_type
+            self.reset_metrics()
+        
     def reset_metrics(self):
         """Reseta todas as métricas para o estado inicial"""
-        self.metrics = {
-            'supermarket': {
-                'person_count': 0,
-                'cart_count': 0,
-                'product_count': 0,
-                'zone_density': defaultdict(int),
-                'average_stay_time': 0,
-                'backpack_count': 0,
-                'handbag_count': 0,
-                'cellphone_count': 0,
-                'peak_hours': defaultdict(int),
-                'object_trends': defaultdict(list),
-                'zone_transitions': defaultdict(int),
-                'performance_metrics': {
-                    'detection_rate': 0,
-                    'processing_time': 0,
-                    'confidence_avg': 0
-                }
-            },
-            'pharmacy': {
-                'person_count': 0,
-                'prescription_count': 0,
-                'medicine_count': 0,
-                'zone_density': defaultdict(int),
-                'average_stay_time': 0,
-                'backpack_count': 0,
-                'handbag_count': 0,
-                'chair_count': 0,
-                'peak_hours': defaultdict(int),
-                'object_trends': defaultdict(list),
-                'zone_transitions': defaultdict(int),
-                'performance_metrics': {
-                    'detection_rate': 0,
-                    'processing_time': 0,
-                    'confidence_avg': 0
-                }
-            },
-            'condominium': {
-                'person_count': 0,
-                'car_count': 0,
-                'bicycle_count': 0,
-                'zone_density': defaultdict(int),
-                'average_stay_time': 0,
-                'dog_count': 0,
-                'cat_count': 0,
-                'backpack_count': 0,
-                'peak_hours': defaultdict(int),
-                'object_trends': defaultdict(list),
-                'zone_transitions': defaultdict(int),
-                'performance_metrics': {
-                    'detection_rate': 0,
-                    'processing_time': 0,
-                    'confidence_avg': 0
-                }
+        with self._lock:
+            self._reset_metrics()
+        
+    def _reset_metrics(self):
+        # Métricas apenas do tipo de negócio atual: contadores das métricas + campos comuns
+        self.metrics = dict.fromkeys(self.business_configs.get(self.business_type, {}).get('class_groups', {}), 0)
+        self.metrics.update({
+            'zone_density': defaultdict(int),
+            'average_stay_time': 0,
+            'peak_hours': np.zeros(24, dtype=np.int32),  # Contagem por hora do dia
+            'object_trends': defaultdict(lambda: deque(maxlen=100)),
+            'zone_transitions': defaultdict(int),
+            'performance_metrics': {
+                'detection_rate': 0,
+                'processing_time': 0,
+                'confidence_avg': 0
             }
-        }
+        })
         
-        self.detection_history = []
+        # Histórico da janela recente: (timestamp, métrica, zona, confiança)
+        self._history_dq = deque()
+        self._metric_counts = Counter()
+        self._zone_counts = Counter()
+        self._conf_sum = 0.0
         self.last_update = time.time()
         self.object_tracking = {}
-        self.object_positions = {}
-        self.object_timestamps = {}
-        self.performance_history = []
-        
-    def _calculate_iou(self, box1, box2):
-        """Calcula o IoU (Intersection over Union) entre duas bounding boxes"""
-        x1 = max(box1[0], box2[0])
-        y1 = max(box1[1], box2[1])
-        x2 = min(box1[2], box2[2])
-        y2 = min(box1[3], box2[3])
-        
-        intersection = max(0, x2 - x1) * max(0, y2 - y1)
-        box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
-        box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
-        union = box1_area + box2_area - intersection
-        
-        return intersection / union if union > 0 else 0
-        
-    def _track_object(self, detection_data):
+        # Espelho vetorizado dos objetos rastreados: as primeiras len(_track_ids) linhas de _tracks
+        self._track_ids = []
+        self._tracks = np.empty(TRACK_CAPACITY, dtype=TRACK_DTYPE)
+        self._next_track_id = 0
+        # Últimos tempos de processamento e sua soma corrente
+        self._perf_dq = deque(maxlen=100)
+        self._perf_sum = 0.0
+        
+    def _track_object(self, detection_data, current_time):
         """Rastreia objetos entre frames usando IoU e Kalman Filter"""
-        current_time = time.time()
         bbox = detection_data['bbox']
         class_name = detection_data['class_name']
         confidence = detection_data.get('confidence', 0)
         
-        # Limpa objetos antigos
-        self.object_tracking = {k: v for k, v in self.object_tracking.items() 
-                              if current_time - v['last_seen'] < 5}
-        
-        # Procura por correspondências
+        # Limpa objetos antigos (só reconstrói os arrays quando algo expirou)
+        tracking = self.object_tracking
+        track_ids = self._track_ids
+        tracks = self._tracks[:len(track_ids)]
+        alive = current_time - tracks['last_seen'] < 5
+        if not alive.all():
+            for row in np.flatnonzero(~alive).tolist():
+                del tracking[track_ids[row]]
+            keep = np.flatnonzero(alive)
+            self._track_ids = track_ids = [track_ids[i] for i in keep.tolist()]
+            self._tracks[:keep.size] = tracks[keep]
+            tracks = self._tracks[:keep.size]
+        
+        # Procura por correspondências entre objetos da mesma classe
         best_match = None
-        best_iou = 0.5  # Threshold mínimo de IoU
-        
-        for obj_id, obj_data in self.object_tracking.items():
-            if obj_data['class'] == class_name:
-                iou = self._calculate_iou(bbox, obj_data['bbox'])
-                if iou > best_iou:
-                    best_iou = iou
-                    best_match = obj_id
+        best_row = None
+        class_id = self._class_ids.setdefault(class_name, len(self._class_ids))
+        same_class = tracks['class_id'] == class_id
+        if same_class.any():
+            query = np.asarray(bbox, dtype=np.float32)
+            best, _ = iou_argmax_above(tracks['bbox'], query, 0.5, same_class)  # Threshold mínimo de IoU
+            if best >= 0:
+                best_row = int(best)
+                best_match = track_ids[best_row]
         
         if best_match is not None:
             # Atualiza objeto existente
-            old_zone = self.object_tracking[best_match]['zone']
+            match = tracking[best_match]
+            old_zone = match['zone']
             new_zone = detection_data.get('zone', 'unknown')
             
             if old_zone != new_zone:
-                self.metrics[self.business_type]['zone_transitions'][f"{old_zone}_to_{new_zone}"] += 1
+                self.metrics['zone_transitions'][f"{old_zone}_to_{new_zone}"] += 1
             
-            self.object_tracking[best_match].update({
+            match.update({
                 'bbox': bbox,
                 'last_seen': current_time,
                 'zone': new_zone,
-                'confidence': confidence,
-                'trajectory': self.object_tracking[best_match].get('trajectory', []) + [bbox]
+                'confidence': confidence
             })
+            match['trajectory'].append(bbox)
+            tracks['bbox'][best_row] = bbox
+            tracks['last_seen'][best_row] = current_time
             return best_match
         else:
             # Cria novo objeto
-            obj_id = f"{class_name}_{len(self.object_tracking)}"
-            self.object_tracking[obj_id] = {
+            obj_id = f"{class_name}_{self._next_track_id}"
+            self._next_track_id += 1
+            tracking[obj_id] = {
                 'class': class_name,
                 'bbox': bbox,
                 'first_seen': current_time,
                 'last_seen': current_time,
                 'zone': detection_data.get('zone', 'unknown'),
                 'confidence': confidence,
-                'trajectory': [bbox]
+                'trajectory': deque([bbox], maxlen=TRAJECTORY_LENGTH)
             }
+            row = len(track_ids)
+            if row == len(self._tracks):
+                grown = np.empty(2 * row, dtype=TRACK_DTYPE)
+                grown[:row] = self._tracks
+                self._tracks = grown
+            self._tracks[row] = (bbox, class_id, current_time, current_time)
+            track_ids.append(obj_id)
             return obj_id
             
+    def process_detections(self, detections, business_type):
+        """Processa as detecções de um frame, descartando-as se o tipo de negócio mudou desde o frame"""
+        with self._lock:
+            if business_type != self.business_type:
+                return
+            # Pula frames inteiros, para que nenhum objeto do frame fique sempre de fora do rastreamento
+            self._skip_ctr += 1
+            if self._skip_ctr % self.frame_skip:
+                return
+            for detection in detections:
+                self._process_detection(detection)
+        
     def process_detection(self, detection_data):
         """Processa uma detecção e atualiza as métricas"""
-        start_time = time.time()
+        with self._lock:
+            self._process_detection(detection_data)
+        
+    def _process_detection(self, detection_data):
+        start_time = time.monotonic()
         current_time = time.time()
+        metrics = self.metrics
+        # Nomes de classe vêm de um conjunto fixo (COCO); internar acelera as buscas em dicts
+        class_name = detection_data['class_name'] = sys.intern(detection_data['class_name'])
         
         # Rastreia o objeto
-        obj_id = self._track_object(detection_data)
-        
-        # Atualiza histórico de detecções
-        self.detection_history.append({
-            'time': current_time,
-            'data': detection_data,
-            'obj_id': obj_id
-        })
+        obj_id = self._track_object(detection_data, current_time)
+        
+        # Atualiza histórico de detecções e contadores da janela
+        metric_key = self._metric_for_class.get(class_name)
+        zone = detection_data.get('zone')
+        history = self._history_dq
+        metric_counts = self._metric_counts
+        zone_counts = self._zone_counts
+        confidence = detection_data.get('confidence', 0)
+        history.append((current_time, metric_key, zone, confidence))
+        if metric_key:
+            metric_counts[metric_key] += 1
+        zone_counts[zone] += 1
+        self._conf_sum += confidence
         
         # Remove detecções antigas (mais de 5 segundos)
-        self.detection_history = [d for d in self.detection_history 
-                                if current_time - d['time'] < 5]
+        cutoff = current_time - HISTORY_WINDOW
+        while history and history[0][0] <= cutoff:
+            _, old_metric, old_zone, old_confidence = history.popleft()
+            if old_metric:
+                metric_counts[old_metric] -= 1
+            zone_counts[old_zone] -= 1
+            self._conf_sum -= old_confidence
+        if len(history) == 1:
+            # Janela reiniciada: descarta o erro de arredondamento acumulado na soma
+            self._conf_sum = confidence
         
         # Atualiza métricas específicas do tipo de negócio
-        if self.business_type == 'supermarket':
-            self._update_supermarket_metrics(detection_data, obj_id)
-        elif self.business_type == 'pharmacy':
-            self._update_pharmacy_metrics(detection_data, obj_id)
-        elif self.business_type == 'condominium':
-            self._update_condominium_metrics(detection_data, obj_id)
+        self._update_metrics(metrics, detection_data, metric_key)
             
         # Atualiza métricas de performance
-        processing_time = time.time() - start_time
-        self.performance_history.append(processing_time)
-        if len(self.performance_history) > 100:
-            self.performance_history.pop(0)
+        processing_time = time.monotonic() - start_time
+        perf_dq = self._perf_dq
+        if len(perf_dq) == perf_dq.maxlen:
+            self._perf_sum -= perf_dq[0]
+        perf_dq.append(processing_time)
+        self._perf_sum += processing_time
             
-        self.metrics[self.business_type]['performance_metrics'].update({
-            'detection_rate': len(self.detection_history) / 5,  # Detecções por segundo
-            'processing_time': np.mean(self.performance_history),
-            'confidence_avg': np.mean([d['data'].get('confidence', 0) for d in self.detection_history])
+        metrics['performance_metrics'].update({
+            'detection_rate': len(history) * self.frame_skip / HISTORY_WINDOW,  # Detecções por segundo
+            'processing_time': self._perf_sum / len(perf_dq),
+            'confidence_avg': self._conf_sum / len(history)
         })
         
         # Atualiza horários de pico
         hour = datetime.fromtimestamp(current_time).hour
-        self.metrics[self.business_type]['peak_hours'][hour] += 1
+        metrics['peak_hours'][hour] += self.frame_skip
         
         # Atualiza tendências
-        self.metrics[self.business_type]['object_trends'][detection_data['class_name']].append(current_time)
-        if len(self.metrics[self.business_type]['object_trends'][detection_data['class_name']]) > 100:
-            self.metrics[self.business_type]['object_trends'][detection_data['class_name']].pop(0)
+        metrics['object_trends'][class_name].append(current_time)
             
         self.last_update = current_time
         
-    def _update_supermarket_metrics(self, detection_data, obj_id):
-        """Atualiza métricas específicas para supermercado"""
-        metrics = self.metrics['supermarket']
-        current_time = time.time()
-        
-        # Contagem de pessoas
-        if detection_data['class_name'] == 'person':
-            metrics['person_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'person' and
-                                         current_time - d['time'] < 5])
-        
-        # Contagem de carrinhos
-        if detection_data['class_name'] == 'shopping cart':
-            metrics['cart_count'] = len([d for d in self.detection_history 
-                                       if d['data']['class_name'] == 'shopping cart' and
-                                       current_time - d['time'] < 5])
-        
-        # Contagem de produtos
-        if detection_data['class_name'] in ['bottle', 'cup', 'bowl', 'banana', 'apple', 'orange', 'sandwich', 'carrot']:
-            metrics['product_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] in ['bottle', 'cup', 'bowl', 'banana', 'apple', 'orange', 'sandwich', 'carrot'] and
-                                         current_time - d['time'] < 5])
-        
-        # NOVOS SERVIÇOS SUPERMERCADO
-        # 1. Contagem de mochilas (backpack)
-        if detection_data['class_name'] == 'backpack':
-            metrics['backpack_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'backpack' and
-                                         current_time - d['time'] < 5])
-        # 2. Contagem de bolsas (handbag)
-        if detection_data['class_name'] == 'handbag':
-            metrics['handbag_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'handbag' and
-                                         current_time - d['time'] < 5])
-        # 3. Contagem de celulares (cell phone)
-        if detection_data['class_name'] == 'cell phone':
-            metrics['cellphone_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'cell phone' and
-                                         current_time - d['time'] < 5])
+    def _update_metrics(self, metrics, detection_data, metric_key):
+        """Atualiza as métricas do tipo de negócio atual"""
+        # Contagem da métrica associada à classe detectada (estimada para todos os frames, com o frame_skip)
+        if metric_key:
+            metrics[metric_key] = self._metric_counts[metric_key] * self.frame_skip
         
         # Densidade por zona
         if 'zone' in detection_data:
-            metrics['zone_density'][detection_data['zone']] = len([d for d in self.detection_history 
-                                                                 if d['data'].get('zone') == detection_data['zone'] and
-                                                                 current_time - d['time'] < 5])
+            metrics['zone_density'][detection_data['zone']] = self._zone_counts[detection_data['zone']] * self.frame_skip
         
         # Tempo médio de permanência
-        stay_times = []
-        for obj_id, obj_data in self.object_tracking.items():
-            if obj_data['class'] == 'person':
-                stay_time = obj_data['last_seen'] - obj_data['first_seen']
-                if stay_time < 300:  # Ignora tempos muito longos
-                    stay_times.append(stay_time)
-        
-        if stay_times:
-            metrics['average_stay_time'] = np.mean(stay_times)
-        
-    def _update_pharmacy_metrics(self, detection_data, obj_id):
-        """Atualiza métricas específicas para farmácia"""
-        metrics = self.metrics['pharmacy']
-        current_time = time.time()
-        
-        # Contagem de pessoas
-        if detection_data['class_name'] == 'person':
-            metrics['person_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'person' and
-                                         current_time - d['time'] < 5])
-        
-        # Contagem de prescrições (simulado)
-        if detection_data['class_name'] == 'book':
-            metrics['prescription_count'] = len([d for d in self.detection_history 
-                                              if d['data']['class_name'] == 'book' and
-                                              current_time - d['time'] < 5])
-        
-        # Contagem de medicamentos
-        if detection_data['class_name'] in ['bottle', 'cup', 'bowl']:
-            metrics['medicine_count'] = len([d for d in self.detection_history 
-                                          if d['data']['class_name'] in ['bottle', 'cup', 'bowl'] and
-                                          current_time - d['time'] < 5])
-        
-        # NOVOS SERVIÇOS FARMÁCIA
-        # 1. Contagem de mochilas (backpack)
-        if detection_data['class_name'] == 'backpack':
-            metrics['backpack_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'backpack' and
-                                         current_time - d['time'] < 5])
-        # 2. Contagem de bolsas (handbag)
-        if detection_data['class_name'] == 'handbag':
-            metrics['handbag_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'handbag' and
-                                         current_time - d['time'] < 5])
-        # 3. Contagem de cadeiras (chair)
-        if detection_data['class_name'] == 'chair':
-            metrics['chair_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'chair' and
-                                         current_time - d['time'] < 5])
-        
-        # Densidade por zona
-        if 'zone' in detection_data:
-            metrics['zone_density'][detection_data['zone']] = len([d for d in self.detection_history 
-                                                                 if d['data'].get('zone') == detection_data['zone'] and
-                                                                 current_time - d['time'] < 5])
-        
-        # Tempo médio de permanência
-        stay_times = []
-        for obj_id, obj_data in self.object_tracking.items():
-            if obj_data['class'] == 'person':
-                stay_time = obj_data['last_seen'] - obj_data['first_seen']
-                if stay_time < 300:  # Ignora tempos muito longos
-                    stay_times.append(stay_time)
-        
-        if stay_times:
-            metrics['average_stay_time'] = np.mean(stay_times)
-        
-    def _update_condominium_metrics(self, detection_data, obj_id):
-        """Atualiza métricas específicas para condomínio"""
-        metrics = self.metrics['condominium']
-        current_time = time.time()
-        
-        # Contagem de pessoas
-        if detection_data['class_name'] == 'person':
-            metrics['person_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'person' and
-                                         current_time - d['time'] < 5])
-        
-        # Contagem de carros
-        if detection_data['class_name'] == 'car':
-            metrics['car_count'] = len([d for d in self.detection_history 
-                                      if d['data']['class_name'] == 'car' and
-                                      current_time - d['time'] < 5])
-        
-        # Contagem de bicicletas
-        if detection_data['class_name'] == 'bicycle':
-            metrics['bicycle_count'] = len([d for d in self.detection_history 
-                                          if d['data']['class_name'] == 'bicycle' and
-                                          current_time - d['time'] < 5])
-        
-        # NOVOS SERVIÇOS CONDOMÍNIO
-        # 1. Contagem de cachorros (dog)
-        if detection_data['class_name'] == 'dog':
-            metrics['dog_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'dog' and
-                                         current_time - d['time'] < 5])
-        # 2. Contagem de gatos (cat)
-        if detection_data['class_name'] == 'cat':
-            metrics['cat_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'cat' and
-                                         current_time - d['time'] < 5])
-        # 3. Contagem de mochilas (backpack)
-        if detection_data['class_name'] == 'backpack':
-            metrics['backpack_count'] = len([d for d in self.detection_history 
-                                         if d['data']['class_name'] == 'backpack' and
-                                         current_time - d['time'] < 5])
-        
-        # Densidade por zona
-        if 'zone' in detection_data:
-            metrics['zone_density'][detection_data['zone']] = len([d for d in self.detection_history 
-                                                                 if d['data'].get('zone') == detection_data['zone'] and
-                                                                 current_time - d['time'] < 5])
-        
-        # Tempo médio de permanência
-        stay_times = []
-        for obj_id, obj_data in self.object_tracking.items():
-            if obj_data['class'] == 'person':
-                stay_time = obj_data['last_seen'] - obj_data['first_seen']
-                if stay_time < 300:  # Ignora tempos muito longos
-                    stay_times.append(stay_time)
-        
-        if stay_times:
-            metrics['average_stay_time'] = np.mean(stay_times)
+        tracks = self._tracks[:len(self._track_ids)]
+        stay_times = tracks['last_seen'] - tracks['first_seen']
+        mask = (tracks['class_id'] == self._class_ids.get('person', -1)) & (stay_times < 300)  # Ignora tempos muito longos
+        if mask.any():
+            metrics['average_stay_time'] = float(stay_times[mask].mean())
         
     def get_business_insights(self):
         """Retorna insights de negócio baseados nas métricas atuais"""
-        metrics = self.metrics[self.business_type]
+        with self._lock:
+            return self._business_insights()
+        
+    def _business_insights(self):
+        metrics = self.metrics
         recommendations = []
         trends = []
         
@@ -417,18 +370,19 @@ class BusinessAnalytics:
         for obj_type, timestamps in metrics['object_trends'].items():
             if len(timestamps) > 10:
                 # Calcula a tendência usando regressão linear
-                x = np.array(range(len(timestamps)))
-                y = np.array(timestamps)
-                slope, _, r_value, _, _ = stats.linregress(x, y)
+                y = np.fromiter(timestamps, dtype=np.float64, count=len(timestamps))
+                slope, r2 = _slope_r2(y)
                 
                 if abs(slope) > 0.1:  # Se há uma tendência significativa
                     trend = "aumentando" if slope > 0 else "diminuindo"
-                    trends.append(f"Tendência de {obj_type} está {trend} (confiança: {r_value**2:.2f})")
+                    trends.append(f"Tendência de {obj_type} está {trend} (confiança: {r2:.2f})")
         
         # Análise de horários de pico
-        peak_hours = sorted(metrics['peak_hours'].items(), key=lambda x: x[1], reverse=True)[:3]
-        if peak_hours:
-            peak_times = [f"{h:02d}:00" for h, _ in peak_hours]
+        hour_counts = metrics['peak_hours']
+        peak_hours = np.argsort(-hour_counts, kind='stable')[:3]
+        peak_hours = peak_hours[hour_counts[peak_hours] > 0]
+        if peak_hours.size:
+            peak_times = [f"{h:02d}:00" for h in peak_hours.tolist()]
             recommendations.append(f"Horários de pico: {', '.join(peak_times)}")
         
         # Análise de transições entre zonas
@@ -443,14 +397,20 @@ class BusinessAnalytics:
             recommendations.append("Performance do sistema pode ser otimizada")
         
         # Verifica thresholds específicos do tipo de negócio
-        for metric, config in self.business_configs[self.business_type]['metrics'].items():
-            if metrics[metric] > config['threshold']:
-                recommendations.append(config['warning'])
+        for metric, threshold, warning in self._threshold_list:
+            if metrics.get(metric, 0) > threshold:
+                recommendations.append(warning)
         
         return {
             'business_type': self.business_type,
-            'metrics': metrics,
+            'metrics': {
+                **metrics,
+                'zone_density': dict(metrics['zone_density']),
+                'zone_transitions': dict(transitions),
+                'peak_hours': {h: int(hour_counts[h]) for h in np.flatnonzero(hour_counts).tolist()},
+                'object_trends': {k: list(v) for k, v in metrics['object_trends'].items()}
+            },
             'recommendations': recommendations,
             'trends': trends,
-            'performance': perf_metrics
+            'performance': dict(perf_metrics)
         } 
\ No newline at end of file
@@ -1,9 +1,42 @@
 import os
 import time
 import json
+import atexit
+import csv
+import mmap
 from datetime import datetime
 import logging
-from collections import deque
+import threading
+from collections import Counter, defaultdict, deque
+from functools import lru_cache
+from itertools import islice
+import numpy as np
+
+try:
+    import orjson
+
+    def _dumps(obj, indent=False):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+
+    _loads = orjson.loads
+except ImportError:  # orjson é opcional
+    def _dumps(obj, indent=False):
+        return json.dumps(obj, indent=2 if indent else None).encode()
+
+    _loads = json.loads
+
+# Buffer do arquivo de log; eventos são gravados em blocos em vez de um write por evento
+LOG_BUFFER_SIZE = 64 * 1024
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+@lru_cache(maxsize=4096)
+def _parse_datetime(text):
+    """Converte a data das linhas CSV antigas em timestamp (linhas vizinhas repetem o segundo)"""
+    return datetime.strptime(text, DATETIME_FORMAT).timestamp()
 
 class EventLogger:
     def __init__(self, log_file='events/events.log', business_type=None):
@@ -15,20 +48,55 @@ class EventLogger:
         self.logger = logging.getLogger(__name__)
         self.max_events = 1000  # Número máximo de eventos em memória
         self.events_buffer = deque(maxlen=self.max_events)
+        # Índice dos eventos por tipo, na mesma ordem de chegada do buffer (só eventos ainda no buffer)
+        self._by_type = defaultdict(deque)
+        # Espelho em arrays circulares (timestamp, confiança, tipo) usado por get_event_stats
+        self._ring_ts = np.zeros(self.max_events, dtype=np.float64)
+        self._ring_conf = np.full(self.max_events, np.nan, dtype=np.float64)
+        self._ring_type = np.empty(self.max_events, dtype=object)
+        self._ring_head = 0
+        self._ring_size = 0
+        # Protege a troca de tipo de negócio/arquivo contra escritas concorrentes
+        self._lock = threading.Lock()
+        # Último segundo formatado em log_event: (segundo, texto)
+        self._datetime_cache = (None, '')
         
-        # Garantir que o diretório existe
-        os.makedirs(os.path.dirname(log_file), exist_ok=True)
-        
-        # Criar arquivo se não existir
-        if not os.path.exists(log_file):
-            with open(log_file, 'w') as f:
-                f.write('')
+        self._open_log_file()
+        atexit.register(self.close)
         
         # Carregar eventos existentes
         self._load_existing_events()
         
         self.logger.info(f"EventLogger inicializado com arquivo: {log_file}")
 
+    def _open_log_file(self):
+        """Abre (criando se preciso) o arquivo de log para escrita em modo append"""
+        os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+        self._fh = open(self.log_file, 'ab', buffering=LOG_BUFFER_SIZE)
+
+    def flush(self):
+        """Grava no disco os eventos pendentes no buffer do arquivo"""
+        with self._lock:
+            self._fh.flush()
+
+    def close(self):
+        """Fecha o arquivo de log, gravando os eventos pendentes"""
+        with self._lock:
+            self._fh.close()
+
+    def set_business_type(self, business_type):
+        """Troca o tipo de negócio e o arquivo de log associado sem recriar o logger"""
+        with self._lock:
+            if business_type == self.business_type:
+                return
+            self.business_type = business_type
+            self.log_file = f'events/events_{business_type}.log'
+            self._clear_buffers()
+            self._fh.close()
+            self._open_log_file()
+            self._load_existing_events()
+        self.logger.info(f"EventLogger alterado para arquivo: {self.log_file}")
+
     def _parse_log_line(self, line):
         """Parse a log line in either JSON or CSV format"""
         line = line.strip()
@@ -36,39 +104,58 @@ class EventLogger:
             return None
             
         try:
-            # Try JSON format first
-            return json.loads(line)
-        except json.JSONDecodeError:
-            try:
-                # Try CSV format (timestamp,object_type,confidence)
-                parts = line.split(',')
-                if len(parts) >= 3:
-                    timestamp = datetime.strptime(parts[0], '%Y-%m-%d %H:%M:%S').timestamp()
-                    return {
-                        'timestamp': timestamp,
-                        'datetime': parts[0],
-                        'type': 'detection',
-                        'data': {
-                            'class_name': parts[1],
-                            'confidence': float(parts[2])
-                        }
+            # O primeiro caractere já distingue JSON de CSV, sem depender de exceções
+            if line[0] == '{':
+                event = _loads(line)
+                # Só aceita eventos com timestamp numérico (e `data`, se houver, como objeto)
+                if (isinstance(event, dict)
+                        and isinstance(event.get('timestamp'), (int, float))
+                        and not isinstance(event['timestamp'], bool)
+                        and isinstance(event.get('data', {}), dict)):
+                    return event
+                return None
+            
+            # CSV format (timestamp,object_type,confidence)
+            parts = line.split(',', 3)
+            if len(parts) >= 3:
+                timestamp = _parse_datetime(parts[0])
+                return {
+                    'timestamp': timestamp,
+                    'datetime': parts[0],
+                    'type': 'detection',
+                    'data': {
+                        'class_name': parts[1],
+                        'confidence': float(parts[2])
                     }
-            except (ValueError, IndexError):
-                pass
+                }
+        except ValueError:  # Inclui JSONDecodeError (json e orjson)
+            pass
                 
         return None
 
     def _load_existing_events(self):
         """Carrega eventos existentes do arquivo de log"""
         try:
-            if os.path.exists(self.log_file):
-                with open(self.log_file, 'r') as f:
-                    for line in f:
+            events = []
+            with open(self.log_file, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return  # mmap não aceita arquivos vazios
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Só os últimos max_events eventos cabem no buffer: lê as linhas do fim para o início
+                    pos = len(mm)
+                    while pos > 0 and len(events) < self.max_events:
+                        start = mm.rfind(b'\n', 0, pos) + 1
+                        line = mm[start:pos].decode('utf-8', errors='replace')
+                        pos = start - 1
+                        if not line.strip():
+                            continue
                         event = self._parse_log_line(line)
                         if event:
-                            self.events_buffer.append(event)
+                            events.append(event)
                         else:
                             self.logger.warning(f"Linha inválida no arquivo de log: {line}")
+            for event in reversed(events):
+                self._append_event(event)
         except Exception as e:
             self.logger.error(f"Erro ao carregar eventos existentes: {str(e)}")
 
@@ -81,47 +168,86 @@ class EventLogger:
             # Criar evento
             event = {
                 'timestamp': timestamp,
-                'datetime': datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+                'datetime': self._format_datetime(timestamp),
                 'type': event_type,
-                'data': data,
-                'business_type': self.business_type
+                'data': data
             }
             
             if confidence is not None:
                 event['confidence'] = confidence
             
-            # Adicionar ao buffer em memória
-            self.events_buffer.append(event)
-            
-            # Escrever no arquivo em formato JSON
-            with open(self.log_file, 'a') as f:
-                f.write(json.dumps(event) + '\n')
+            with self._lock:
+                event['business_type'] = self.business_type
+                
+                # Adicionar ao buffer em memória
+                self._append_event(event)
+                
+                # Escrever no arquivo em formato JSON
+                self._fh.write(_dumps(event) + b'\n')
             
             self.logger.debug(f"Evento registrado: {event}")
             
         except Exception as e:
             self.logger.error(f"Erro ao registrar evento: {str(e)}")
 
+    def _append_event(self, event):
+        """Adiciona um evento ao buffer, ao índice por tipo e aos arrays circulares"""
+        if len(self.events_buffer) == self.max_events:
+            # O evento mais antigo sai do buffer: sai também do índice do seu tipo (é o primeiro de lá)
+            oldest_type = self.events_buffer[0].get('type')
+            same_type = self._by_type[oldest_type]
+            same_type.popleft()
+            if not same_type:
+                del self._by_type[oldest_type]
+        self.events_buffer.append(event)
+        self._by_type[event.get('type')].append(event)
+        
+        confidence = event.get('confidence')
+        if confidence is None:
+            confidence = event.get('data', {}).get('confidence')
+        head = self._ring_head
+        self._ring_ts[head] = event['timestamp']
+        try:
+            self._ring_conf[head] = np.nan if confidence is None else confidence
+        except (TypeError, ValueError):
+            self._ring_conf[head] = np.nan
+        self._ring_type[head] = event.get('type')
+        self._ring_head = (head + 1) % self.max_events
+        self._ring_size = min(self._ring_size + 1, self.max_events)
+
+    def _clear_buffers(self):
+        """Esvazia o buffer de eventos e as estruturas derivadas"""
+        self.events_buffer.clear()
+        self._by_type.clear()
+        self._ring_head = 0
+        self._ring_size = 0
+
+    def _format_datetime(self, timestamp):
+        """Formata o timestamp, reaproveitando o texto enquanto o segundo não muda"""
+        second = int(timestamp)
+        cached_second, text = self._datetime_cache
+        if second != cached_second:
+            text = datetime.fromtimestamp(second).strftime(DATETIME_FORMAT)
+            self._datetime_cache = (second, text)
+        return text
+
+    def _iter_events(self, event_type=None, start_time=None, end_time=None):
+        """Percorre os eventos filtrados do mais recente ao mais antigo (chamar com self._lock)"""
+        source = self._by_type.get(event_type, ()) if event_type else self.events_buffer
+        # Buffers estão em ordem de chegada: para no primeiro evento anterior à janela
+        for event in reversed(source):
+            timestamp = event['timestamp']
+            if start_time and timestamp < start_time:
+                break
+            if end_time and timestamp > end_time:
+                continue
+            yield event
+
     def get_events(self, limit=100, event_type=None, start_time=None, end_time=None):
         """Obtém eventos filtrados do buffer em memória"""
         try:
-            events = list(self.events_buffer)
-            
-            # Aplicar filtros
-            if event_type:
-                events = [e for e in events if e['type'] == event_type]
-            
-            if start_time:
-                events = [e for e in events if e['timestamp'] >= start_time]
-            
-            if end_time:
-                events = [e for e in events if e['timestamp'] <= end_time]
-            
-            # Ordenar por timestamp (mais recentes primeiro)
-            events.sort(key=lambda x: x['timestamp'], reverse=True)
-            
-            # Limitar número de eventos
-            return events[:limit]
+            with self._lock:
+                return list(islice(self._iter_events(event_type, start_time, end_time), limit))
             
         except Exception as e:
             self.logger.error(f"Erro ao obter eventos: {str(e)}")
@@ -133,36 +259,29 @@ class EventLogger:
             current_time = time.time()
             start_time = current_time - time_window
             
-            events = self.get_events(
-                limit=None,
-                event_type=event_type,
-                start_time=start_time,
-                end_time=current_time
-            )
-            
             stats = {
-                'total_events': len(events),
+                'total_events': 0,
                 'events_per_type': {},
                 'average_confidence': 0,
                 'time_window': time_window
             }
             
-            if events:
-                # Contagem por tipo
-                for event in events:
-                    event_type = event['type']
-                    stats['events_per_type'][event_type] = stats['events_per_type'].get(event_type, 0) + 1
-                
-                # Média de confiança
-                confidences = []
-                for event in events:
-                    if 'confidence' in event:
-                        confidences.append(event['confidence'])
-                    elif 'data' in event and 'confidence' in event['data']:
-                        confidences.append(event['data']['confidence'])
-                        
-                if confidences:
-                    stats['average_confidence'] = sum(confidences) / len(confidences)
+            # Filtra a janela sobre os arrays circulares (a ordem dos slots não importa aqui)
+            with self._lock:
+                size = self._ring_size
+                timestamps = self._ring_ts[:size]
+                mask = (timestamps >= start_time) & (timestamps <= current_time)
+                if event_type:
+                    mask &= self._ring_type[:size] == event_type
+                types = self._ring_type[:size][mask]
+                confidences = self._ring_conf[:size][mask]
+            
+            type_counts = Counter(types.tolist())
+            stats['total_events'] = int(types.size)
+            stats['events_per_type'] = dict(type_counts)
+            confidences = confidences[~np.isnan(confidences)]
+            if confidences.size:
+                stats['average_confidence'] = float(confidences.mean())
             
             return stats
             
@@ -178,9 +297,10 @@ class EventLogger:
     def clear_events(self):
         """Limpa todos os eventos do arquivo de log e do buffer"""
         try:
-            with open(self.log_file, 'w') as f:
-                f.write('')
-            self.events_buffer.clear()
+            with self._lock:
+                self._fh.seek(0)
+                self._fh.truncate()
+                self._clear_buffers()
             self.logger.info("Eventos limpos com sucesso")
         except Exception as e:
             self.logger.error(f"Erro ao limpar eventos: {str(e)}")
@@ -195,17 +315,22 @@ class EventLogger:
             events = list(self.events_buffer)
             
             if format == 'json':
-                with open(filepath, 'w') as f:
-                    json.dump(events, f, indent=2)
+                with open(filepath, 'wb') as f:
+                    f.write(_dumps(events, indent=True))
             elif format == 'csv':
-                with open(filepath, 'w') as f:
-                    f.write('timestamp,datetime,type,confidence,data\n')
+                with open(filepath, 'w', newline='', buffering=LOG_BUFFER_SIZE) as f:
+                    writer = csv.writer(f)
+                    writer.writerow(('timestamp', 'datetime', 'type', 'confidence', 'data'))
+                    data_cache = {}  # id(data) -> JSON, para dados compartilhados entre eventos
                     for event in events:
+                        data = event.get('data', {})
                         confidence = event.get('confidence', '')
-                        if not confidence and 'data' in event and 'confidence' in event['data']:
-                            confidence = event['data']['confidence']
-                        data = json.dumps(event.get('data', {}))
-                        f.write(f"{event['timestamp']},{event['datetime']},{event['type']},{confidence},{data}\n")
+                        if not confidence and 'confidence' in data:
+                            confidence = data['confidence']
+                        data_json = data_cache.get(id(data))
+                        if data_json is None:
+                            data_json = data_cache[id(data)] = _dumps(data).decode()
+                        writer.writerow((event['timestamp'], event['datetime'], event['type'], confidence, data_json))
             else:
                 raise ValueError(f"Formato não suportado: {format}")
             
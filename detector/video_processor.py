@@ -4,13 +4,144 @@ import logging
 from ultralytics import YOLO
 from ultralytics.nn.tasks import DetectionModel
 from .business_analytics import BusinessAnalytics
+from ._fastpost import postprocess_boxes
+from ._iou_numba import iou_matrix
+from scipy.optimize import linear_sum_assignment
 import time
 import os
 import threading
-from queue import Queue
 import torch
 import torch.nn.modules.container as container
-from collections import defaultdict
+from collections import defaultdict, deque
+from queue import SimpleQueue
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+except ImportError:  # PyTurboJPEG é opcional; sem ele o cv2.imencode é usado
+    TurboJPEG = None
+
+# Um thread por chamada do OpenCV, para não competir com os threads do YOLO
+cv2.setNumThreads(1)
+
+# Carrega os módulos CUDA sob demanda (inicialização mais rápida e menos memória)
+os.environ.setdefault('CUDA_MODULE_LOADING', 'LAZY')
+
+# Modelo PyTorch e engine TensorRT FP16 exportada a partir dele
+MODEL_PATH = os.environ.get('MODEL_PATH', 'yolov8n.pt')
+ENGINE_PATH = os.path.splitext(MODEL_PATH)[0] + '.engine'
+
+# Compilação do modelo PyTorch na GPU quando a engine TensorRT não está disponível
+TORCH_COMPILE = os.environ.get('TORCH_COMPILE', '1') == '1'
+
+# Frames agrupados por chamada ao modelo no thread de processamento
+BATCH_SIZE = 4
+
+# Frames cuja miniatura em tons de cinza tem menos que MOTION_CHANGED_FRACTION dos pixels alterados
+# (diferença acima de MOTION_PIXEL_DELTA) em relação à do último frame enviado ao modelo reaproveitam
+# as detecções dele, por no máximo MOTION_MAX_REUSE frames seguidos
+MOTION_SIZE = (160, 90)
+MOTION_PIXEL_DELTA = 25
+MOTION_CHANGED_FRACTION = 0.001  # ~14 pixels da miniatura: um objeto pequeno em movimento já conta
+MOTION_MAX_REUSE = 5
+
+# Máximo de caixas mantidas pelo NMS por frame
+MAX_DETECTIONS = 100
+
+# Maior lado do frame entregue ao modelo (o YOLO redimensiona para 640 de qualquer forma)
+MODEL_INPUT_SIZE = 640
+
+# Classes monitoradas por tipo de negócio
+SUPERMARKET_CLASSES = frozenset({'person', 'shopping cart', 'backpack', 'handbag', 'cell phone', 'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl'})
+PHARMACY_CLASSES = frozenset({'person', 'backpack', 'handbag', 'chair', 'bottle', 'cell phone', 'book'})
+CONDOMINIUM_CLASSES = frozenset({'person', 'car', 'truck', 'motorcycle', 'dog', 'cat', 'backpack', 'handbag', 'suitcase'})
+
+# Zonas horizontais do frame e seus limites (fração da largura)
+ZONE_NAMES = np.array(['entrance', 'middle', 'exit'])
+ZONE_BOUNDS = np.array([0.33, 0.66])
+
+# Associação de detecções a objetos rastreados: IoU mínimo e frames sem correspondência tolerados
+TRACK_MIN_IOU = 0.3
+TRACK_MAX_MISSED = 5
+
+# Máximo de frames com detecções aguardando a análise de negócio (acima disso são descartados)
+ANALYTICS_QUEUE_LIMIT = 1000
+
+# Largura máxima e qualidade dos frames JPEG enviados no stream
+STREAM_WIDTH = 960
+JPEG_QUALITY = 60
+JPEG_WORKERS = 2  # Threads de codificação (o OpenCV/libjpeg-turbo liberam o GIL)
+
+# Cabeçalho de cada parte do stream multipart (boundary=frame)
+FRAME_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n'
+
+# Modelo compartilhado entre as instâncias (carregado, exportado e compilado uma única vez).
+# O predictor do Ultralytics guarda estado entre chamadas, então a inferência é serializada.
+_MODEL = None
+_MODEL_LOCK = threading.Lock()
+_INFERENCE_LOCK = threading.Lock()
+
+# Margem da imagem da label em torno do fundo, para o traço do texto que o ultrapassa
+LABEL_MARGIN = 4
+
+
+@lru_cache(maxsize=1024)
+def _render_label(label, color):
+    """Rasteriza uma label (fundo na cor da classe e texto branco) e retorna (imagem, máscara, topo)
+
+    A imagem começa LABEL_MARGIN pixels à esquerda de x1 e `topo` pixels acima de y1.
+    """
+    (label_width, label_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)
+    top = label_height + 10
+    size = (top + baseline + 1 + LABEL_MARGIN, label_width + 1 + 2 * LABEL_MARGIN)
+    image = np.zeros(size + (3,), dtype=np.uint8)
+    mask = np.zeros(size, dtype=np.uint8)
+    # Mesmos traços do desenho direto: fundo de (x1, y1-altura-10) a (x1+largura, y1) e texto em (x1, y1-5)
+    for target, fill, text in ((image, color, (255, 255, 255)), (mask, 1, 1)):
+        cv2.rectangle(target, (LABEL_MARGIN, 0), (LABEL_MARGIN + label_width, top), fill, -1)
+        cv2.putText(target, label, (LABEL_MARGIN, top - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, text, 2)
+    return image, mask, top
+
+
+def _draw_label(frame, label, color, x, y):
+    """Copia a label pré-rasterizada para o frame com o canto inferior esquerdo do fundo em (x, y)"""
+    image, mask, top = _render_label(label, color)
+    x -= LABEL_MARGIN
+    y -= top
+    height, width = frame.shape[:2]
+    left, upper = max(x, 0), max(y, 0)
+    right, lower = min(x + image.shape[1], width), min(y + image.shape[0], height)
+    if left >= right or upper >= lower:
+        return
+    # cv2.copyTo escreve diretamente na região do frame (bem mais rápido que np.copyto com where)
+    cv2.copyTo(image[upper - y:lower - y, left - x:right - x], mask[upper - y:lower - y, left - x:right - x],
+               frame[upper:lower, left:right])
+
+class CudaVideoCapture:
+    """Leitura de stream decodificado na GPU (NVDEC) com a interface usada do cv2.VideoCapture"""
+
+    def __init__(self, source):
+        self.reader = cv2.cudacodec.createVideoReader(source)
+
+    def isOpened(self):
+        return self.reader is not None
+
+    def set(self, prop, value):
+        # O decodificador de hardware não aceita as propriedades do VideoCapture
+        return False
+
+    def read(self):
+        ok, gpu_frame = self.reader.nextFrame()
+        if not ok:
+            return False, None
+        if gpu_frame.channels() == 4:
+            gpu_frame = cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGRA2BGR)
+        return True, gpu_frame.download()
+
+    def release(self):
+        self.reader = None
+
 
 class VideoProcessor:
     def __init__(self, business_type='supermarket'):
@@ -19,22 +150,65 @@ class VideoProcessor:
         # Carrega o modelo YOLO com verificação
         try:
             torch.serialization.add_safe_globals([DetectionModel, container.Sequential])
-            self.model = YOLO('yolov8n.pt')
+            self.model = self._get_model()
             if not hasattr(self.model, 'predict'):
                 raise Exception("Modelo YOLO não carregado corretamente")
         except Exception as e:
             self.logger.error(f"Erro ao carregar modelo YOLO: {str(e)}")
             raise
+        
+        # Na GPU: inferência em FP16 e buffers/kernels preparados antes do primeiro frame
+        self.use_half = torch.cuda.is_available()
+        if self.use_half:
+            torch.backends.cudnn.benchmark = True
+            self._warmup_model()
             
         self.business_analytics = BusinessAnalytics(business_type)
+        # Métricas de negócio atualizadas em segundo plano, sem bloquear o thread de detecção
+        self._analytics_queue = SimpleQueue()
+        self._analytics_thread = threading.Thread(target=self._analytics_loop, daemon=True)
+        self._analytics_thread.start()
         self.cap = None
         self.is_running = False
         self.current_frame = None
         self.frame_interval = 0.033  # ~30 FPS
         self.last_detection_time = 0
         self.detection_interval = 0.05  # Reduzido para 50ms entre detecções
-        self.frame_queue = Queue(maxsize=1)  # Buffer mínimo
+        # Frames mais recentes aguardando detecção (os mais antigos são descartados)
+        self._pending_frames = deque(maxlen=BATCH_SIZE)
+        self._frames_cv = threading.Condition()
+        # JPEGs dos frames processados (seq, future do pool de codificação); não são consumidos,
+        # cada cliente do stream guarda o último seq que enviou
+        self.current_chunk_ring = deque(maxlen=2 * BATCH_SIZE)
+        self._chunk_seq = 0  # seq do último frame publicado (crescente, não volta a zero)
+        self._chunks_cv = threading.Condition()  # Avisa os clientes do stream quando chega um lote novo
+        self._turbojpeg = TurboJPEG() if TurboJPEG is not None else None
+        self._jpeg_pool = ThreadPoolExecutor(max_workers=JPEG_WORKERS)
+        # Tela de espera quando não há vídeo, desenhada e codificada uma única vez
+        waiting_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        cv2.putText(waiting_frame, "Aguardando video...",
+                    (200, 240), cv2.FONT_HERSHEY_SIMPLEX,
+                    1, (255, 255, 255), 2)
+        self._waiting_chunk = self._encode_chunk(waiting_frame)
+        self._raw_chunk = (None, None)  # (frame, JPEG) do frame original enviado antes do primeiro lote
+        # Compila os kernels de pós-processamento e de associação antes do primeiro frame
+        postprocess_boxes(np.zeros((1, 4), dtype=np.float32), 1.0, 1.0, 1, 1, ZONE_BOUNDS)
+        iou_matrix(np.zeros((1, 4), dtype=np.float32), np.zeros((1, 4), dtype=np.float32))
+        # Limites das zonas em pixels, recalculados só quando a largura do frame muda
+        self._zone_width = None
+        self._zone_bounds = None
         self.processing_thread = None
+        self.capture_thread = None
+        # Sinal de parada da sessão atual; cada connect cria o seu, para que threads de uma
+        # sessão anterior (ex.: presas numa leitura RTSP além do join) nunca continuem na nova
+        self._stop_event = threading.Event()
+        self._stop_event.set()
+        # Serializa connect/disconnect (rotas e uploads em threads diferentes) para nunca haver duas sessões
+        self._session_lock = threading.Lock()
+        self._latest_raw = None  # Último frame lido da fonte, ainda sem detecções
+        self._motion_ref = None  # (shape, miniatura) do último frame enviado ao modelo
+        self._reused_frames = 0  # Frames seguidos que reaproveitaram o último resultado
+        self._last_result = None  # (tipo de negócio, resultado) do último frame enviado ao modelo
         self.frame_count = 0
         self.last_frame_time = 0
         self.processing_delay = 0
@@ -43,11 +217,13 @@ class VideoProcessor:
         
         # Configurações de RTSP otimizadas
         os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = 'rtsp_transport;tcp|buffer_size;1024'
+        # Decodificação H.264 na GPU (NVDEC) quando o OpenCV foi compilado com CUDA
+        self.use_nvdec = hasattr(cv2, 'cudacodec') and cv2.cuda.getCudaEnabledDeviceCount() > 0
         
         # Configurações de classes e limiares por tipo de negócio
         self.class_configs = {
             'supermarket': {
-                'classes': ['person', 'shopping cart', 'backpack', 'handbag', 'cell phone', 'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl'],
+                'classes': SUPERMARKET_CLASSES,
                 'thresholds': {
                     'person': 0.4,  # Reduzido para capturar mais detecções
                     'shopping cart': 0.3,
@@ -64,7 +240,7 @@ class VideoProcessor:
                 }
             },
             'pharmacy': {
-                'classes': ['person', 'backpack', 'handbag', 'chair', 'bottle', 'cell phone', 'book'],
+                'classes': PHARMACY_CLASSES,
                 'thresholds': {
                     'person': 0.4,
                     'backpack': 0.3,
@@ -76,7 +252,7 @@ class VideoProcessor:
                 }
             },
             'condominium': {
-                'classes': ['person', 'car', 'truck', 'motorcycle', 'dog', 'cat', 'backpack', 'handbag', 'suitcase'],
+                'classes': CONDOMINIUM_CLASSES,
                 'thresholds': {
                     'person': 0.4,
                     'car': 0.3,
@@ -91,11 +267,27 @@ class VideoProcessor:
             }
         }
         
+        # Índices das classes monitoradas no modelo, para o NMS já descartar as demais
+        for config in self.class_configs.values():
+            config['class_ids'] = sorted(class_id for class_id, name in self.model.names.items()
+                                         if name in config['classes'])
+        
+        # Limiar de confiança indexado pelo índice da classe (infinito para classes não monitoradas)
+        num_classes = max(self.model.names) + 1
+        for config in self.class_configs.values():
+            min_conf = np.full(num_classes, np.inf)
+            for class_id in config['class_ids']:
+                min_conf[class_id] = config['thresholds'].get(self.model.names[class_id], 0.25)
+            config['min_conf_by_id'] = min_conf
+            # Confiança mínima passada ao modelo: o NMS já descarta o que nenhuma classe aceitaria
+            config['min_conf'] = min(config['thresholds'].values())
+        
         # Inicializa o rastreador de objetos com histórico reduzido
-        self.tracked_objects = {}
+        self.tracked_objects = {}  # id -> {'bbox': [x1, y1, x2, y2], 'missed': frames sem correspondência}
         self.next_object_id = 0
-        self.object_history = defaultdict(list)
         self.max_history_length = 10  # Reduzido para melhor performance
+        # Trajetórias com descarte automático dos pontos mais antigos
+        self.object_history = defaultdict(lambda: deque(maxlen=self.max_history_length))
         
         # Configurações de cores para visualização
         self.colors = {
@@ -113,10 +305,66 @@ class VideoProcessor:
             'cell phone': (255, 165, 0), # Laranja
             'default': (255, 255, 255)  # Branco
         }
+        # Cor indexada pelo índice da classe
+        self._color_by_id = [self.colors.get(self.model.names.get(class_id), self.colors['default'])
+                             for class_id in range(num_classes)]
         self.logger.info(f"Inicializado processador de vídeo para {business_type}")
 
+    def _get_model(self):
+        """Retorna o modelo compartilhado, carregando-o na primeira chamada"""
+        global _MODEL
+        if _MODEL is None:
+            with _MODEL_LOCK:
+                if _MODEL is None:
+                    _MODEL = self._load_model()
+        return _MODEL
+
+    def _load_model(self):
+        """Carrega a engine TensorRT FP16, se já exportada, ou o modelo PyTorch"""
+        if torch.cuda.is_available():
+            if os.path.exists(ENGINE_PATH):
+                try:
+                    model = YOLO(ENGINE_PATH, task='detect')
+                    self.logger.info(f"Engine TensorRT carregada: {ENGINE_PATH}")
+                    return model
+                except Exception as e:
+                    self.logger.warning(f"TensorRT indisponível, usando modelo PyTorch: {str(e)}")
+            else:
+                # A exportação leva minutos: é feita antes de subir o servidor (python -m detector.video_processor)
+                self.logger.info(f"Engine TensorRT não encontrada ({ENGINE_PATH}), usando modelo PyTorch")
+        model = YOLO(MODEL_PATH)
+        # Funde Conv+BatchNorm uma única vez (a engine TensorRT já vem otimizada)
+        model.fuse()
+        if torch.cuda.is_available() and TORCH_COMPILE:
+            self._compile_model(model)
+        return model
+
+    def _compile_model(self, model):
+        """Na GPU sem TensorRT: pesos em channels-last e rede compilada pelo TorchInductor (requer Triton)"""
+        try:
+            import triton  # noqa: F401  (backend do TorchInductor na GPU)
+            model.model = model.model.to(memory_format=torch.channels_last)
+            model.model = torch.compile(model.model, mode='reduce-overhead', fullgraph=False)
+            self.logger.info("Modelo PyTorch compilado com torch.compile (channels-last)")
+        except Exception as e:
+            self.logger.warning(f"torch.compile indisponível, usando modelo sem compilação: {str(e)}")
+
+    def _warmup_model(self):
+        """Executa um lote vazio para alocar os buffers da GPU e escolher os kernels antes do stream"""
+        try:
+            frame = np.zeros((360, MODEL_INPUT_SIZE, 3), dtype=np.uint8)
+            with _INFERENCE_LOCK, torch.inference_mode():
+                self.model([frame] * BATCH_SIZE, half=True, verbose=False)
+        except Exception as e:
+            self.logger.warning(f"Falha no aquecimento do modelo: {str(e)}")
+
     def connect(self, source):
-        """Conecta à fonte de vídeo"""
+        """Conecta à fonte de vídeo, substituindo a sessão anterior de forma atômica"""
+        with self._session_lock:
+            return self._connect(source)
+
+    def _connect(self, source):
+        """Para a sessão atual e abre a nova fonte (chamado com _session_lock)"""
         try:
             self.stop_detection()  # Para qualquer detecção em andamento
             
@@ -126,7 +374,7 @@ class VideoProcessor:
             else:
                 # Configurações específicas para RTSP otimizadas
                 os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = 'rtsp_transport;tcp|buffer_size;1024'
-                self.cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+                self.cap = self._open_stream(source)
             
             if not self.cap.isOpened():
                 raise Exception("Não foi possível abrir a fonte de vídeo")
@@ -142,14 +390,22 @@ class VideoProcessor:
                 raise Exception("Não foi possível ler frames da fonte de vídeo")
             
             # Inicia o processamento
+            stop = self._stop_event = threading.Event()
             self.is_running = True
-            self.start_time = time.time()
+            self.start_time = time.monotonic()
+            self.last_frame_time = self.start_time
+            self._latest_raw = frame
             
             # Inicia thread de processamento
-            self.processing_thread = threading.Thread(target=self._process_frames_thread)
+            self.processing_thread = threading.Thread(target=self._process_frames_thread, args=(stop,))
             self.processing_thread.daemon = True
             self.processing_thread.start()
             
+            # Inicia thread de leitura da fonte, independente do cliente HTTP
+            self.capture_thread = threading.Thread(target=self._capture_loop, args=(self.cap, stop))
+            self.capture_thread.daemon = True
+            self.capture_thread.start()
+            
             self.logger.info(f"Conectado à fonte de vídeo: {source}")
             return True
             
@@ -160,105 +416,182 @@ class VideoProcessor:
                 self.cap = None
             return False
 
+    def _open_stream(self, source):
+        """Abre o stream com decodificação na GPU, voltando ao FFMPEG na CPU em caso de falha"""
+        if self.use_nvdec:
+            try:
+                return CudaVideoCapture(source)
+            except Exception as e:
+                self.logger.warning(f"NVDEC indisponível para {source}, usando FFMPEG: {str(e)}")
+        return cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+
     def disconnect(self):
         """Desconecta da fonte de vídeo"""
-        self.stop_detection()
+        with self._session_lock:
+            self.stop_detection()
         self.logger.info("Desconectado da fonte de vídeo")
 
     def stop_detection(self):
         """Para o processamento de vídeo"""
+        self._stop_event.set()
         self.is_running = False
+        with self._frames_cv:
+            self._frames_cv.notify_all()
+        with self._chunks_cv:
+            self._chunks_cv.notify_all()
         if self.processing_thread:
             self.processing_thread.join(timeout=1.0)
+        if self.capture_thread:
+            self.capture_thread.join(timeout=1.0)
         if self.cap:
             self.cap.release()
         self.cap = None
         self.current_frame = None
-        while not self.frame_queue.empty():
-            self.frame_queue.get()
+        self._latest_raw = None
+        self._raw_chunk = (None, None)
+        self._motion_ref = None
+        self._last_result = None
+        with self._chunks_cv:
+            self.current_chunk_ring.clear()
+        with self._frames_cv:
+            self._pending_frames.clear()
         self.logger.info("Detecção parada")
 
     def _is_valid_frame(self, frame):
-        """Verifica se o frame é válido"""
-        if frame is None or frame.size == 0:
-            return False
-        if frame.shape[0] == 0 or frame.shape[1] == 0:
-            return False
-        return True
+        """Verifica se o frame é válido (size == 0 cobre qualquer dimensão vazia)"""
+        return frame is not None and frame.size > 0
+
+    def _next_batch(self, stop):
+        """Coleta até BATCH_SIZE frames pendentes, esperando no máximo o tempo de um lote"""
+        pending = self._pending_frames
+        with self._frames_cv:
+            if not self._frames_cv.wait_for(lambda: pending or stop.is_set(), timeout=0.1):
+                return []
+            self._frames_cv.wait_for(lambda: len(pending) >= BATCH_SIZE or stop.is_set(),
+                                     timeout=self.frame_interval * BATCH_SIZE)
+            if stop.is_set():
+                return []  # Sessão encerrada: os frames pendentes pertencem à próxima
+            frames = list(pending)
+            pending.clear()
+        # Os frames já foram validados na leitura, antes de entrarem na fila
+        return frames
+
+    def _capture_loop(self, cap, stop):
+        """Thread que lê a fonte no ritmo do vídeo e entrega os frames ao thread de processamento"""
+        next_frame_time = time.monotonic()
+        while not stop.is_set() and cap is self.cap:
+            try:
+                ret, frame = cap.read()
+                if stop.is_set():
+                    break  # A leitura bloqueou além do stop: o cap já foi liberado
+                if not ret or not self._is_valid_frame(frame):
+                    self.logger.warning("Erro ao ler frame, tentando reconectar...")
+                    time.sleep(0.05)  # Reduzido para melhor resposta
+                    continue
 
-    def _process_frames_thread(self):
-        """Thread para processar frames em background"""
-        while self.is_running:
+                self._latest_raw = frame
+                # Envia o frame para o thread de processamento (o mais antigo sai se o lote estiver cheio)
+                with self._frames_cv:
+                    self._pending_frames.append(frame)
+                    self._frames_cv.notify()
+
+                # Mantém a taxa da fonte (~30 FPS) com prazos no relógio monotônico; arquivos locais seriam lidos sem limite
+                next_frame_time += self.frame_interval
+                delay = next_frame_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame_time = time.monotonic()
+            except Exception as e:
+                self.logger.error(f"Erro na leitura de frames: {str(e)}")
+                time.sleep(0.05)
+
+    def _analytics_loop(self):
+        """Thread que aplica as detecções de cada frame às métricas de negócio"""
+        while True:
+            business_type, detections = self._analytics_queue.get()
+            try:
+                self.business_analytics.process_detections(detections, business_type)
+            except Exception as e:
+                self.logger.error(f"Erro ao atualizar métricas: {str(e)}")
+
+    def _process_frames_thread(self, stop):
+        """Thread para processar frames em background, em lotes de até BATCH_SIZE"""
+        while not stop.is_set():
             try:
-                if not self.frame_queue.empty():
-                    frame = self.frame_queue.get()
-                    if self._is_valid_frame(frame):
-                        # Calcula o atraso de processamento
-                        current_time = time.time()
-                        processing_time = current_time - self.last_frame_time
-                        self.processing_delay = processing_time - self.frame_interval
-                        
-                        # Ajusta o número de frames a pular baseado no atraso
-                        if self.processing_delay > 0.1:  # Se o atraso for maior que 100ms
-                            self.skip_frames = min(self.max_skip_frames, int(self.processing_delay / self.frame_interval))
-                        else:
-                            self.skip_frames = 0
-                        
-                        # Processa o frame apenas se não estiver muito atrasado
-                        if self.skip_frames == 0:
-                            processed_frame = self.process_frame(frame)
-                            if processed_frame is not None:
-                                self.current_frame = processed_frame
-                                self.last_frame_time = current_time
-                        else:
-                            self.logger.debug(f"Pulando {self.skip_frames} frames devido ao atraso de {self.processing_delay:.3f}s")
-                            
-                    self.frame_queue.task_done()
-                time.sleep(0.001)  # Reduzido para melhor responsividade
+                frames = self._next_batch(stop)
+                if not frames:
+                    continue
+                
+                # Calcula o atraso de processamento na fronteira do lote
+                current_time = time.monotonic()
+                processing_time = current_time - self.last_frame_time
+                self.processing_delay = processing_time - self.frame_interval * len(frames)
+                self.last_frame_time = current_time
+                
+                # Ajusta o número de frames a pular baseado no atraso
+                if self.processing_delay > 0.1:  # Se o atraso for maior que 100ms
+                    self.skip_frames = min(self.max_skip_frames, int(self.processing_delay / self.frame_interval))
+                else:
+                    self.skip_frames = 0
+                
+                # Processa o lote apenas se não estiver muito atrasado
+                if self.skip_frames == 0:
+                    processed_frames = self.process_batch(frames)
+                    # Codifica cada frame uma única vez, fora deste thread; o mesmo future serve todos os clientes do stream
+                    chunks = [self._jpeg_pool.submit(self._encode_chunk, frame) for frame in processed_frames]
+                    self.current_frame = processed_frames[-1]
+                    with self._chunks_cv:
+                        if stop.is_set():
+                            break  # Lote de uma sessão já encerrada: não entra no stream da próxima
+                        for chunk in chunks:
+                            self._chunk_seq += 1
+                            self.current_chunk_ring.append((self._chunk_seq, chunk))
+                        self._chunks_cv.notify_all()
+                else:
+                    self.logger.debug(f"Pulando {len(frames)} frames devido ao atraso de {self.processing_delay:.3f}s")
             except Exception as e:
                 self.logger.error(f"Erro no processamento de frames: {str(e)}")
                 time.sleep(1)
 
-    def _update_tracker(self, frame, detections):
-        """Atualiza o rastreador de objetos"""
-        current_objects = set()
+    def _update_tracker(self, detections):
+        """Associa as detecções do frame aos objetos rastreados (IoU + algoritmo húngaro)"""
+        track_ids = list(self.tracked_objects)
+        det_boxes = np.array([det['bbox'] for det in detections], dtype=np.float32).reshape(-1, 4)
+        matched_tracks = set()
+        matched_dets = set()
         
-        # Atualiza objetos existentes
-        for obj_id, tracker in list(self.tracked_objects.items()):
-            success, bbox = tracker.update(frame)
-            if success:
-                x, y, w, h = [int(v) for v in bbox]
-                current_objects.add(obj_id)
-                self.object_history[obj_id].append((x + w/2, y + h/2))
-                if len(self.object_history[obj_id]) > self.max_history_length:
-                    self.object_history[obj_id].pop(0)
-            else:
-                del self.tracked_objects[obj_id]
-                del self.object_history[obj_id]
+        # Atualiza objetos existentes com a detecção de maior sobreposição
+        if track_ids and len(det_boxes):
+            track_boxes = np.array([self.tracked_objects[obj_id]['bbox'] for obj_id in track_ids], dtype=np.float32)
+            ious = iou_matrix(track_boxes, det_boxes)
+            for row, col in zip(*linear_sum_assignment(ious, maximize=True)):
+                if ious[row, col] < TRACK_MIN_IOU:
+                    continue
+                obj_id = track_ids[row]
+                x1, y1, x2, y2 = detections[col]['bbox']
+                self.tracked_objects[obj_id] = {'bbox': [x1, y1, x2, y2], 'missed': 0}
+                self.object_history[obj_id].append(((x1 + x2) / 2, (y1 + y2) / 2))
+                matched_tracks.add(obj_id)
+                matched_dets.add(col)
+        
+        # Remove objetos sem correspondência por mais de TRACK_MAX_MISSED frames
+        for obj_id in track_ids:
+            if obj_id not in matched_tracks:
+                track = self.tracked_objects[obj_id]
+                track['missed'] += 1
+                if track['missed'] > TRACK_MAX_MISSED:
+                    del self.tracked_objects[obj_id]
+                    self.object_history.pop(obj_id, None)
         
         # Adiciona novos objetos
-        for det in detections:
+        for index, det in enumerate(detections):
+            if index in matched_dets:
+                continue
             x1, y1, x2, y2 = det['bbox']
-            w, h = x2 - x1, y2 - y1
-            bbox = (x1, y1, w, h)
-            
-            # Verifica se o objeto já está sendo rastreado
-            is_new = True
-            for obj_id, tracker in self.tracked_objects.items():
-                success, existing_bbox = tracker.update(frame)
-                if success:
-                    ex, ey, ew, eh = [int(v) for v in existing_bbox]
-                    if abs(ex - x1) < 50 and abs(ey - y1) < 50:
-                        is_new = False
-                        break
-            
-            if is_new:
-                # Cria um novo rastreador KCF
-                tracker = cv2.TrackerKCF_create()
-                tracker.init(frame, bbox)
-                self.tracked_objects[self.next_object_id] = tracker
-                self.object_history[self.next_object_id] = [(x1 + w/2, y1 + h/2)]
-                self.next_object_id += 1
+            self.tracked_objects[self.next_object_id] = {'bbox': [x1, y1, x2, y2], 'missed': 0}
+            self.object_history[self.next_object_id].append(((x1 + x2) / 2, (y1 + y2) / 2))
+            self.next_object_id += 1
 
     def _draw_tracking(self, frame):
         """Desenha as trajetórias dos objetos rastreados"""
@@ -278,109 +611,152 @@ class VideoProcessor:
                     cv2.putText(frame, label, (int(x), int(y)-5),
                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
 
-    def _determine_zone(self, x1, y1, x2, y2, frame_shape):
-        """Determina a zona do objeto baseado em sua posição"""
-        height, width = frame_shape[:2]
-        center_x = (x1 + x2) / 2
-        center_y = (y1 + y2) / 2
-        
-        # Divide o frame em zonas
-        if center_x < width * 0.33:
-            return 'entrance'
-        elif center_x < width * 0.66:
-            return 'middle'
-        else:
-            return 'exit'
+    def _prepare_frame(self, frame):
+        """Redimensiona o frame para melhor performance"""
+        height, width = frame.shape[:2]
+        if width > 1280:  # Limita a largura máxima
+            scale = 1280 / width
+            frame = cv2.resize(frame, None, fx=scale, fy=scale)
+        return frame
+
+    def _model_input(self, frame):
+        """Reduz o maior lado do frame ao tamanho de entrada do modelo com o cv2 (as caixas são reescaladas depois)"""
+        height, width = frame.shape[:2]
+        scale = MODEL_INPUT_SIZE / max(height, width)
+        if scale >= 1:
+            return frame
+        return cv2.resize(frame, (round(width * scale), round(height * scale)),
+                          interpolation=cv2.INTER_LINEAR)
 
     def process_frame(self, frame):
         """Processa um frame e retorna o frame com detecções"""
+        if not self._is_valid_frame(frame):
+            return frame
+        return self.process_batch([frame])[0]
+
+    def process_batch(self, frames):
+        """Processa um lote de frames com uma única chamada ao modelo"""
+        frames = [self._prepare_frame(frame) for frame in frames]
+        business_config = self.class_configs.get(self.business_analytics.business_type, self.class_configs['supermarket'])
+        motion_state = (self._motion_ref, self._reused_frames)
+        try:
+            inputs = [self._model_input(frame) for frame in frames]
+            business_type = self.business_analytics.business_type
+            # Só os frames com movimento passam pelo modelo; sem resultado reaproveitável, o primeiro também
+            if self._last_result is None or self._last_result[0] != business_type:
+                self._motion_ref = None
+            static = [self._is_static(model_input) for model_input in inputs]
+            # Realiza a detecção só nas classes do tipo de negócio, a partir do menor limiar entre elas
+            run_inputs = [model_input for model_input, skip in zip(inputs, static) if not skip]
+            run_results = []
+            if run_inputs:
+                with _INFERENCE_LOCK, torch.inference_mode():
+                    run_results = self.model(run_inputs, conf=business_config['min_conf'], classes=business_config['class_ids'],
+                                             max_det=MAX_DETECTIONS, half=self.use_half, verbose=False)
+        except Exception as e:
+            # A referência de movimento só vale para frames que chegaram a ter resultado
+            self._motion_ref, self._reused_frames = motion_state
+            self.logger.error(f"Erro ao processar frame: {str(e)}")
+            return frames
+        # Frames estáticos reaproveitam o resultado do último frame que passou pelo modelo
+        run_results = iter(run_results)
+        results = []
+        for skip in static:
+            if not skip:
+                self._last_result = (business_type, next(run_results))
+            results.append(self._last_result[1])
+        return [self._annotate_frame(frame, result, model_input.shape)
+                for frame, result, model_input in zip(frames, results, inputs)]
+
+    def _motion_thumbnail(self, frame):
+        """Miniatura em tons de cinza usada na comparação entre frames"""
+        small = cv2.resize(frame, MOTION_SIZE, interpolation=cv2.INTER_AREA)
+        return frame.shape, cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def _is_static(self, frame):
+        """Indica se o frame quase não mudou desde o último enviado ao modelo (senão ele vira a nova referência)"""
+        shape, small = thumbnail = self._motion_thumbnail(frame)
+        reference = self._motion_ref
+        if (reference is not None and reference[0] == shape and self._reused_frames < MOTION_MAX_REUSE):
+            _, changed = cv2.threshold(cv2.absdiff(reference[1], small), MOTION_PIXEL_DELTA, 255, cv2.THRESH_BINARY)
+            if cv2.countNonZero(changed) < MOTION_CHANGED_FRACTION * small.size:
+                self._reused_frames += 1
+                return True
+        self._motion_ref = thumbnail
+        self._reused_frames = 0
+        return False
+
+    def _annotate_frame(self, frame, result, input_shape):
+        """Aplica as detecções de um resultado do modelo (sobre um frame de tamanho `input_shape`): métricas, desenho e rastreamento"""
         try:
-            if not self._is_valid_frame(frame):
-                return frame
-                
-            # Redimensiona o frame para melhor performance
-            height, width = frame.shape[:2]
-            if width > 1280:  # Limita a largura máxima
-                scale = 1280 / width
-                frame = cv2.resize(frame, None, fx=scale, fy=scale)
-            
             # Obtém configurações do tipo de negócio atual
-            business_config = self.class_configs.get(self.business_analytics.business_type, self.class_configs['supermarket'])
-            allowed_classes = business_config['classes']
-            thresholds = business_config['thresholds']
-            
-            # Realiza a detecção com confiança mínima reduzida
-            results = self.model(frame, conf=0.25)
+            business_type = self.business_analytics.business_type
+            business_config = self.class_configs.get(business_type, self.class_configs['supermarket'])
             
             detections = []
+            # Copia todas as caixas do dispositivo de uma vez (uma sincronização por frame)
+            boxes = result.boxes
+            height, width = frame.shape[:2]
+            xyxy = boxes.xyxy.cpu().numpy()
+            confidences = boxes.conf.cpu().numpy()
+            class_ids = boxes.cls.cpu().numpy().astype(np.int32)
+            # Mantém só as classes do tipo de negócio que atingem o limiar da própria classe
+            keep = confidences >= business_config['min_conf_by_id'][class_ids]
+            if not keep.all():
+                xyxy, confidences, class_ids = xyxy[keep], confidences[keep], class_ids[keep]
+            # Reescala do frame reduzido entregue ao modelo para o frame original, limita as
+            # coordenadas ao frame e determina a zona de cada caixa pela posição do centro
+            input_height, input_width = input_shape[:2]
+            if width != self._zone_width:
+                self._zone_bounds = ZONE_BOUNDS * width
+                self._zone_width = width
+            xyxy, zone_ids = postprocess_boxes(xyxy, width / input_width, height / input_height,
+                                               width, height, self._zone_bounds)
+            zones = ZONE_NAMES[zone_ids].tolist()
+            confidences = confidences.tolist()
+            class_ids = class_ids.tolist()
+            # Referências resolvidas uma vez por frame, fora do laço das detecções
+            names = result.names
+            color_by_id = self._color_by_id
+            
+            # Desenha as caixas com linha mais grossa, uma chamada por cor (as labels ficam por cima)
+            corners = xyxy[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+            indices_by_color = defaultdict(list)
+            for index, class_id in enumerate(class_ids):
+                indices_by_color[color_by_id[class_id]].append(index)
+            for color, indices in indices_by_color.items():
+                cv2.polylines(frame, corners[indices], True, color, 4)
+            
             # Processa as detecções
-            for result in results:
-                boxes = result.boxes
-                for box in boxes:
-                    try:
-                        # Extrai informações da detecção
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        confidence = float(box.conf[0])
-                        class_id = int(box.cls[0])
-                        class_name = result.names[class_id]
-                        
-                        # Verifica se a classe é permitida e se atinge o limiar
-                        if class_name in allowed_classes and confidence >= thresholds.get(class_name, 0.25):
-                            # Verifica se as coordenadas estão dentro dos limites do frame
-                            height, width = frame.shape[:2]
-                            x1 = max(0, min(int(x1), width-1))
-                            y1 = max(0, min(int(y1), height-1))
-                            x2 = max(0, min(int(x2), width-1))
-                            y2 = max(0, min(int(y2), height-1))
-                            
-                            # Determina a zona baseado na posição do objeto
-                            zone = self._determine_zone(x1, y1, x2, y2, frame.shape)
-                            
-                            # Adiciona à lista de detecções
-                            detections.append({
-                                'class_name': class_name,
-                                'confidence': confidence,
-                                'bbox': [x1, y1, x2, y2],
-                                'zone': zone
-                            })
-                            
-                            # Atualiza métricas de negócio imediatamente
-                            self.business_analytics.process_detection(detections[-1])
-                            
-                            # Desenha a detecção no frame com cores mais vibrantes
-                            color = self.colors.get(class_name, self.colors['default'])
-                            
-                            # Desenha a caixa de detecção com linha mais grossa
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 4)
-                            
-                            # Prepara o texto da label
-                            label = f"{class_name}: {confidence:.2f}"
-                            
-                            # Calcula o tamanho do texto para criar o fundo
-                            (label_width, label_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)
-                            
-                            # Desenha o fundo do texto
-                            cv2.rectangle(frame, 
-                                        (x1, y1-label_height-10), 
-                                        (x1+label_width, y1), 
-                                        color, 
-                                        -1)
-                            
-                            # Desenha o texto com fonte maior
-                            cv2.putText(frame, 
-                                      label, 
-                                      (x1, y1-5),
-                                      cv2.FONT_HERSHEY_SIMPLEX, 
-                                      0.8, 
-                                      (255, 255, 255), 
-                                      2)
-                            
-                    except Exception as e:
-                        self.logger.error(f"Erro ao processar detecção: {str(e)}")
-                        continue
-                        
+            for (x1, y1, x2, y2), confidence, class_id, zone in zip(xyxy.tolist(), confidences, class_ids, zones):
+                try:
+                    class_name = names[class_id]
+                    
+                    # Adiciona à lista de detecções
+                    detections.append({
+                        'class_name': class_name,
+                        'confidence': confidence,
+                        'bbox': [x1, y1, x2, y2],
+                        'zone': zone
+                    })
+                    
+                    # Prepara o texto da label na cor da classe
+                    color = color_by_id[class_id]
+                    label = f"{class_name}: {confidence:.2f}"
+                    
+                    # Copia a label já rasterizada (fundo + texto) do cache
+                    _draw_label(frame, label, color, x1, y1)
+                    
+                except Exception as e:
+                    self.logger.error(f"Erro ao processar detecção: {str(e)}")
+                    continue
+            
+            # Envia as detecções do frame para a análise de negócio, marcadas com o tipo de negócio do frame
+            if detections and self._analytics_queue.qsize() < ANALYTICS_QUEUE_LIMIT:
+                self._analytics_queue.put((business_type, detections))
+                    
             # Atualiza o tracker e desenha as trajetórias
-            self._update_tracker(frame, detections)
+            self._update_tracker(detections)
             self._draw_tracking(frame)
             
             return frame
@@ -389,39 +765,82 @@ class VideoProcessor:
             self.logger.error(f"Erro ao processar frame: {str(e)}")
             return frame
 
+    def _encode_jpeg(self, frame):
+        """Converte o frame para JPEG na resolução do stream (None em caso de falha)"""
+        height, width = frame.shape[:2]
+        if width > STREAM_WIDTH:
+            frame = cv2.resize(frame, (STREAM_WIDTH, height * STREAM_WIDTH // width),
+                               interpolation=cv2.INTER_AREA)
+        if self._turbojpeg is not None:
+            return self._turbojpeg.encode(frame, quality=JPEG_QUALITY,
+                                          pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY,
+                                                   cv2.IMWRITE_JPEG_OPTIMIZE, 0])
+        return buffer if ret else None
+
+    def _encode_chunk(self, frame):
+        """Codifica o frame como uma parte do stream multipart (None em caso de falha)"""
+        buffer = self._encode_jpeg(frame)
+        if buffer is None:
+            return None
+        return b''.join((FRAME_HEADER % len(buffer), buffer, b'\r\n'))
+
+    def _encode_raw_chunk(self, frame):
+        """Codifica o frame original uma única vez para todos os clientes (o último JPEG fica guardado)"""
+        cached_frame, chunk = self._raw_chunk
+        if cached_frame is not frame:
+            chunk = self._encode_chunk(frame)
+            self._raw_chunk = (frame, chunk)
+        return chunk
+
+    def _next_chunk(self, last_seq):
+        """Retorna (seq, future) do frame seguinte a `last_seq` no buffer, sem removê-lo (future None antes do primeiro lote)"""
+        ring = self.current_chunk_ring
+        with self._chunks_cv:
+            if ring and ring[-1][0] <= last_seq:
+                # Sem frame novo: aguarda o próximo lote em vez de reenviar o último JPEG
+                self._chunks_cv.wait_for(lambda: not ring or ring[-1][0] > last_seq or not self.is_running,
+                                         timeout=0.1)
+            if not ring:
+                return last_seq, None
+            for entry in ring:
+                if entry[0] > last_seq:
+                    # Cliente atrasado além do buffer: continua a partir do frame mais antigo disponível
+                    return entry
+            # Após o tempo limite, repete o último frame para manter a conexão ativa
+            return ring[-1]
+
     def generate_frames(self):
         """Generate frames for video streaming"""
+        next_frame_time = time.monotonic()
+        last_seq = 0  # seq do último frame enviado a este cliente
         while True:
             try:
                 if not self.is_running or self.cap is None:
-                    # Tela de espera quando não há vídeo
-                    frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                    cv2.putText(frame, "Aguardando video...",
-                              (200, 240), cv2.FONT_HERSHEY_SIMPLEX,
-                              1, (255, 255, 255), 2)
+                    chunk = self._waiting_chunk
                 else:
-                    ret, frame = self.cap.read()
-                    if not ret or not self._is_valid_frame(frame):
-                        self.logger.warning("Erro ao ler frame, tentando reconectar...")
-                        time.sleep(0.05)  # Reduzido para melhor resposta
+                    # Transmite o próximo frame processado (já codificado no pool)
+                    last_seq, future = self._next_chunk(last_seq)
+                    if future is not None:
+                        chunk = future.result()
+                    elif self._latest_raw is not None:
+                        # Até o primeiro lote, o frame original
+                        chunk = self._encode_raw_chunk(self._latest_raw)
+                    else:
+                        time.sleep(0.01)
                         continue
 
-                    # Processa o frame diretamente
-                    processed_frame = self.process_frame(frame)
-                    if processed_frame is not None:
-                        frame = processed_frame
-
-                # Converte o frame para JPEG com qualidade otimizada
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
-                if not ret:
+                if chunk is None:
                     continue
+                yield chunk
 
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-
-                # Delay mínimo para evitar sobrecarga
-                time.sleep(0.001)
+                # Mantém a taxa da fonte (~30 FPS); a leitura segue no seu próprio thread
+                next_frame_time += self.frame_interval
+                delay = next_frame_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame_time = time.monotonic()
 
             except Exception as e:
                 self.logger.error(f"Erro ao gerar frame: {str(e)}")
@@ -429,4 +848,29 @@ class VideoProcessor:
 
     def get_metrics(self):
         """Retorna as métricas atuais"""
-        return self.business_analytics.get_business_insights() 
\ No newline at end of file
+        return self.business_analytics.get_business_insights() 
+
+
+def export_engine():
+    """Exporta MODEL_PATH para uma engine TensorRT FP16 em ENGINE_PATH, se houver GPU e a engine ainda não existir"""
+    logger = logging.getLogger(__name__)
+    if not torch.cuda.is_available():
+        logger.info("GPU indisponível, exportação TensorRT ignorada")
+        return False
+    if os.path.exists(ENGINE_PATH):
+        logger.info(f"Engine TensorRT já existe: {ENGINE_PATH}")
+        return True
+    try:
+        logger.info(f"Exportando {MODEL_PATH} para TensorRT FP16...")
+        YOLO(MODEL_PATH).export(format='engine', half=True, imgsz=MODEL_INPUT_SIZE, device=0,
+                                batch=BATCH_SIZE, dynamic=True)
+        return True
+    except Exception as e:
+        logger.warning(f"Falha na exportação TensorRT, o servidor usará o modelo PyTorch: {str(e)}")
+        return False
+
+
+if __name__ == '__main__':
+    # Etapa de build/entrypoint: python -m detector.video_processor
+    logging.basicConfig(level=logging.INFO)
+    export_engine()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Permite importar o pacote `detector` rodando `pytest` a partir da raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,125 @@
+"""Contagens da janela deslizante comparadas com a semântica original (listas filtradas a cada detecção)"""
+import types
+import time
+
+import numpy as np
+import pytest
+
+from detector import business_analytics
+from detector.business_analytics import HISTORY_WINDOW, BusinessAnalytics
+
+CLASSES = ['person', 'bottle', 'cup', 'shopping cart', 'backpack', 'handbag', 'cell phone', 'car']
+ZONES = ['entrance', 'middle', 'exit']
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Relógio controlado pelo teste no lugar de time.time() do módulo"""
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(business_analytics, 'time',
+                        types.SimpleNamespace(time=lambda: now[0], monotonic=time.monotonic))
+    return now
+
+
+def _baseline_counts(history, current_time, classes=None, zone=None):
+    """Contagem original: detecções dos últimos HISTORY_WINDOW segundos (filtradas por classe ou zona)"""
+    return len([d for d in history
+                if current_time - d['time'] < HISTORY_WINDOW
+                and (classes is None or d['class_name'] in classes)
+                and (zone is None or d['zone'] == zone)])
+
+
+@pytest.mark.parametrize('business_type', ['supermarket', 'pharmacy', 'condominium'])
+def test_window_counts_match_baseline(clock, business_type):
+    rng = np.random.default_rng(0)
+    analytics = BusinessAnalytics(business_type)
+    class_groups = analytics.business_configs[business_type]['class_groups']
+    metric_for_class = {name: key for key, names in class_groups.items() for name in names}
+    history = []
+
+    for step in range(400):
+        clock[0] += float(rng.choice([0.05, 0.3, 1.0, 2.5]))
+        x, y = rng.uniform(0, 600, size=2)
+        detection = {
+            'class_name': str(rng.choice(CLASSES)),
+            'bbox': [x, y, x + 40, y + 80],
+            'confidence': float(rng.uniform(0.3, 1.0)),
+            'zone': str(rng.choice(ZONES)),
+        }
+        analytics.process_detection(dict(detection))
+        history.append({'time': clock[0], **detection})
+
+        metrics = analytics.metrics
+        metric_key = metric_for_class.get(detection['class_name'])
+        if metric_key:
+            assert metrics[metric_key] == _baseline_counts(history, clock[0], classes=class_groups[metric_key])
+        zone = detection['zone']
+        assert metrics['zone_density'][zone] == _baseline_counts(history, clock[0], zone=zone)
+        window = [d for d in history if clock[0] - d['time'] < HISTORY_WINDOW]
+        performance = metrics['performance_metrics']
+        assert performance['detection_rate'] == pytest.approx(len(window) / HISTORY_WINDOW)
+        assert performance['confidence_avg'] == pytest.approx(np.mean([d['confidence'] for d in window]))
+
+
+def _baseline_iou(box1, box2):
+    x1, y1 = max(box1[0], box2[0]), max(box1[1], box2[1])
+    x2, y2 = min(box1[2], box2[2]), min(box1[3], box2[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (box1[2] - box1[0]) * (box1[3] - box1[1]) + (box2[2] - box2[0]) * (box2[3] - box2[1]) - intersection
+    return intersection / union if union > 0 else 0
+
+
+def test_tracker_matches_baseline(clock):
+    """O rastreamento vetorizado associa as detecções aos mesmos objetos que o laço original"""
+    rng = np.random.default_rng(1)
+    analytics = BusinessAnalytics('supermarket')
+    baseline = {}  # id -> (classe, bbox, last_seen)
+    ids = {}  # id do rastreamento atual -> id do original
+    matched = 0
+
+    for step in range(300):
+        clock[0] += float(rng.choice([0.1, 0.5, 6.0], p=[0.6, 0.35, 0.05]))
+        class_name = str(rng.choice(['person', 'bottle']))
+        x, y = rng.choice([0, 100, 200]) + rng.uniform(0, 15, size=2)
+        bbox = [float(x), float(y), float(x) + 60, float(y) + 60]
+
+        baseline = {k: v for k, v in baseline.items() if clock[0] - v[2] < 5}
+        best, best_iou = None, 0.5
+        for obj_id, (obj_class, obj_bbox, _) in baseline.items():
+            if obj_class == class_name:
+                iou = _baseline_iou(bbox, obj_bbox)
+                if iou > best_iou:
+                    best, best_iou = obj_id, iou
+        if best is None:
+            best = step
+        else:
+            matched += 1
+        baseline[best] = (class_name, bbox, clock[0])
+
+        obj_id = analytics._track_object({'class_name': class_name, 'bbox': bbox, 'zone': 'middle'}, clock[0])
+        assert ids.setdefault(obj_id, best) == best
+        assert len(analytics._track_ids) == len(baseline)
+    assert 0 < matched < 300
+
+
+def test_frame_skip_scales_counts(clock):
+    detections = [{'class_name': 'person', 'bbox': [10, 10, 60, 110], 'confidence': 0.9, 'zone': 'entrance'},
+                  {'class_name': 'bottle', 'bbox': [300, 10, 340, 60], 'confidence': 0.8, 'zone': 'middle'}]
+    results = {}
+    for frame_skip in (1, 2):
+        analytics = BusinessAnalytics('supermarket')
+        analytics.frame_skip = frame_skip
+        for _ in range(20):
+            clock[0] += 0.1
+            analytics.process_detections([dict(d) for d in detections], 'supermarket')
+        results[frame_skip] = (analytics.metrics['person_count'], analytics.metrics['product_count'],
+                               dict(analytics.metrics['zone_density']), len(analytics._track_ids))
+    assert results[1] == results[2]
+
+
+def test_stale_business_type_is_dropped(clock):
+    analytics = BusinessAnalytics('supermarket')
+    analytics.set_business_type('pharmacy')
+    analytics.process_detections([{'class_name': 'person', 'bbox': [0, 0, 10, 10], 'confidence': 1.0,
+                                   'zone': 'entrance'}], 'supermarket')
+    assert analytics.metrics['person_count'] == 0
@@ -0,0 +1,64 @@
+"""Leitura das linhas do arquivo de log (JSON atual e CSV antigo)"""
+import json
+from datetime import datetime
+
+import pytest
+
+from detector.event_logger import EventLogger
+
+
+@pytest.fixture
+def event_logger(tmp_path):
+    logger = EventLogger(str(tmp_path / 'events.log'))
+    yield logger
+    logger.close()
+
+
+def test_parse_json_line(event_logger):
+    event = {'timestamp': 1700000000.5, 'datetime': '2023-11-14 22:13:20', 'type': 'detection',
+             'data': {'class_name': 'person', 'confidence': 0.9}, 'business_type': 'supermarket'}
+    assert event_logger._parse_log_line(json.dumps(event) + '\n') == event
+
+
+@pytest.mark.parametrize('line', [
+    '{"type": "detection", "data": {}}',          # sem timestamp
+    '{"timestamp": "ontem", "type": "detection"}',  # timestamp não numérico
+    '{"timestamp": true, "type": "detection"}',   # bool não conta como número
+    '{"timestamp": 1.0, "data": [1, 2]}',          # data que não é objeto
+    '{"timestamp": 1.0',                           # JSON truncado
+    '[1, 2, 3]',
+])
+def test_parse_rejects_invalid_json(event_logger, line):
+    assert event_logger._parse_log_line(line) is None
+
+
+def test_parse_legacy_csv_line(event_logger):
+    event = event_logger._parse_log_line('2024-01-02 10:20:30,person,0.85\r\n')
+    assert event == {
+        'timestamp': datetime(2024, 1, 2, 10, 20, 30).timestamp(),
+        'datetime': '2024-01-02 10:20:30',
+        'type': 'detection',
+        'data': {'class_name': 'person', 'confidence': 0.85},
+    }
+
+
+@pytest.mark.parametrize('line', ['', '   \n', 'person,0.85', '2024-13-45 10:20:30,person,0.85',
+                                  '2024-01-02 10:20:30,person,alta'])
+def test_parse_rejects_invalid_csv(event_logger, line):
+    assert event_logger._parse_log_line(line) is None
+
+
+def test_load_skips_invalid_lines(tmp_path):
+    log_file = tmp_path / 'events.log'
+    log_file.write_text('\n'.join([
+        json.dumps({'timestamp': 1.0, 'type': 'a', 'data': {}}),
+        json.dumps({'type': 'sem_timestamp'}),
+        '2024-01-02 10:20:30,person,0.85',
+        json.dumps({'timestamp': 3.0, 'type': 'c', 'data': {'confidence': 0.5}}),
+    ]) + '\n')
+    logger = EventLogger(str(log_file))
+    try:
+        assert [event['type'] for event in logger.events_buffer] == ['a', 'detection', 'c']
+        assert logger._ring_size == 3
+    finally:
+        logger.close()
@@ -0,0 +1,75 @@
+"""Equivalência entre os kernels de IoU compilados com numba e as implementações em NumPy"""
+import numpy as np
+import pytest
+
+from detector._iou_numba import (
+    NUMBA_AVAILABLE,
+    _iou_argmax_above_numpy,
+    _iou_batch_numpy,
+    _iou_matrix_numpy,
+    iou_argmax_above,
+    iou_batch,
+    iou_matrix,
+)
+
+pytestmark = pytest.mark.skipif(not NUMBA_AVAILABLE, reason="numba não instalado (só existe a versão NumPy)")
+
+
+def _random_boxes(rng, n):
+    """Caixas (N, 4) em float32, incluindo algumas degeneradas (área zero)"""
+    xy = rng.uniform(0, 500, size=(n, 2))
+    wh = rng.uniform(0, 150, size=(n, 2))
+    wh[::7] = 0
+    return np.hstack([xy, xy + wh]).astype(np.float32)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_iou_batch_matches_numpy(seed):
+    rng = np.random.default_rng(seed)
+    boxes = _random_boxes(rng, 50)
+    for query in _random_boxes(rng, 10):
+        expected = _iou_batch_numpy(boxes, query, np.empty(len(boxes), dtype=np.float32))
+        result = iou_batch(boxes, query, np.empty(len(boxes), dtype=np.float32))
+        np.testing.assert_allclose(result, expected, atol=1e-6)
+
+
+@pytest.mark.parametrize("shape", [(0, 5), (5, 0), (1, 1), (20, 30)])
+def test_iou_matrix_matches_numpy(shape):
+    rng = np.random.default_rng(sum(shape))
+    boxes_a = _random_boxes(rng, shape[0]).reshape(-1, 4)
+    boxes_b = _random_boxes(rng, shape[1]).reshape(-1, 4)
+    result = iou_matrix(boxes_a, boxes_b)
+    assert result.shape == shape
+    np.testing.assert_allclose(result, _iou_matrix_numpy(boxes_a, boxes_b), atol=1e-6)
+
+
+def test_iou_matrix_rows_match_iou_batch():
+    rng = np.random.default_rng(42)
+    boxes_a = _random_boxes(rng, 8)
+    boxes_b = _random_boxes(rng, 12)
+    matrix = iou_matrix(boxes_a, boxes_b)
+    for i, query in enumerate(boxes_a):
+        row = _iou_batch_numpy(boxes_b, query, np.empty(len(boxes_b), dtype=np.float32))
+        np.testing.assert_allclose(matrix[i], row, atol=1e-6)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_iou_argmax_above_matches_numpy(seed):
+    rng = np.random.default_rng(seed)
+    boxes = _random_boxes(rng, 40)
+    mask = rng.random(40) < 0.7
+    for query in _random_boxes(rng, 10):
+        for thr in (0.0, 0.3, 0.5):
+            expected_index, expected_iou = _iou_argmax_above_numpy(boxes, query, thr, mask)
+            index, iou = iou_argmax_above(boxes, query, thr, mask)
+            assert index == expected_index
+            assert iou == pytest.approx(expected_iou, abs=1e-6)
+
+
+def test_iou_argmax_above_empty_mask():
+    boxes = np.array([[0, 0, 10, 10]], dtype=np.float32)
+    query = np.array([0, 0, 10, 10], dtype=np.float32)
+    mask = np.zeros(1, dtype=np.bool_)
+    assert iou_argmax_above(boxes, query, 0.5, mask) == (-1, 0.5)
+    assert _iou_argmax_above_numpy(boxes, query, 0.5, mask) == (-1, 0.5)
+
@@ -0,0 +1,4 @@
+"""
+Ponto de entrada WSGI para servidores de produção (gunicorn).
+"""
+from app import app